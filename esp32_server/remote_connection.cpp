@@ -174,25 +174,24 @@ void RemoteConnection::commander() {
       commander_client = new_client;
     }
 
-    if (!commander_client.available()) {
-      continue;
-    }
-
-    String message = commander_client.readStringUntil(MESSAGE_DELIMITER);
-    Command command = Command(message.c_str());
+    // Drain every buffered command so a batch sent in one write is answered within a single refresh
+    while (commander_client.available()) {
+      String message = commander_client.readStringUntil(MESSAGE_DELIMITER);
+      Command command = Command(message.c_str());
 
-    if (command_handler == nullptr) {
-      commander_client.println(ResponseVOID(command).as_json());
-    }
-    else {
-      Response* response = command_handler(command);
-      if (response == nullptr) {
-        response = new ResponseVOID(command);
+      if (command_handler == nullptr) {
+        commander_client.println(ResponseVOID(command).as_json());
+      }
+      else {
+        Response* response = command_handler(command);
+        if (response == nullptr) {
+          response = new ResponseVOID(command);
+        }
+        String reply = String(response->as_json());
+        commander_client.println(reply);
+
+        delete response;
       }
-      String message = String(response->as_json());
-      commander_client.print(message);
-
-      delete response;
     }
   }
 }
@@ -0,0 +1,55 @@
+# bench_codecs.py
+# Encode and decode cost, and bytes on the wire, of each codec for typical messages
+# Run from the interface_client folder: python benchmarks/bench_codecs.py
+
+import json
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from timeit import Timer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from wire_codec import codecs, decode_frame, JSON_LIBRARY, JSON_CODEC, BINARY_CODEC, msgpack
+
+messages = {
+    "command": {"command": "set_bridge_position", "kwargs": {"position": 0.5}, "ticket": 1024},
+    "response": {"response": "DATA", "payload": {"position": 0.25, "lights": "STOP"}, "ticket": 1024},
+    "update": {"current_position": 0.375, "bridge_lights": "STOP"},
+}
+
+
+def stdlib_encode(message: dict) -> bytes:
+    # What RemoteInterface did before codecs existed
+    return (json.dumps(message) + "\n").encode()
+
+
+def per_call(function, repeat: int) -> float:
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    return best * 1e9
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Wire codec benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    encoders = {
+        "json (stdlib)": (stdlib_encode, json.loads),
+        f"json ({JSON_LIBRARY})": (codecs[JSON_CODEC].encode, decode_frame),
+        f"msgpack ({'msgpack' if msgpack else 'built-in'})": (codecs[BINARY_CODEC].encode, decode_frame),
+    }
+
+    print(f"{'codec':<22}{'message':<10}{'bytes':>7}{'encode ns':>12}{'decode ns':>12}")
+    for codec_name, (encode, decode) in encoders.items():
+        for message_name, message in messages.items():
+            frame = encode(message)
+            body = frame.rstrip(b"\n")
+            if decode(body) != message:
+                raise AssertionError(f"{codec_name} did not round trip the {message_name} message")
+
+            encode_time = per_call(lambda: encode(message), arguments.repeat)
+            decode_time = per_call(lambda: decode(body), arguments.repeat)
+            print(f"{codec_name:<22}{message_name:<10}{len(frame):>7}{encode_time:>12.0f}{decode_time:>12.0f}")
@@ -0,0 +1,95 @@
+# bench_framing.py
+# Throughput of the stream decoder under the read patterns TCP produces at high update rates
+# Run from the interface_client folder: python benchmarks/bench_framing.py
+
+import json
+import socket
+import sys
+import threading
+from argparse import ArgumentParser
+from pathlib import Path
+from random import Random
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from framing import StreamDecoder
+from remote_interface import BUFFER_SIZE
+
+
+def make_updates(count: int) -> list[bytes]:
+    updates = []
+    for index in range(count):
+        update = {"current_position": round((index % 1000) / 1000.0, 3), "bridge_lights": "STOP", "sequence": index}
+        updates.append(json.dumps(update).encode() + b"\r\n")
+    return updates
+
+
+def chunk_stream(stream: bytes, random: Random) -> list[bytes]:
+    # Arbitrary read sizes, so reads both split single updates and merge bursts of them
+    chunks = []
+    position = 0
+    while position < len(stream):
+        size = random.randint(1, BUFFER_SIZE)
+        chunks.append(stream[position:position + size])
+        position += size
+    return chunks
+
+
+def check(messages: list[bytes], count: int) -> None:
+    if len(messages) != count:
+        raise AssertionError(f"Expected {count} messages, decoded {len(messages)}")
+    for index, message in enumerate(messages):
+        if json.loads(message)["sequence"] != index:
+            raise AssertionError(f"Message {index} was corrupted")
+
+
+def bench_in_memory(count: int, seed: int) -> float:
+    chunks = chunk_stream(b"".join(make_updates(count)), Random(seed))
+
+    decoder = StreamDecoder()
+    messages = []
+    start = perf_counter()
+    for chunk in chunks:
+        messages.extend(decoder.feed(chunk))
+    elapsed = perf_counter() - start
+
+    check(messages, count)
+    return count / elapsed
+
+
+def bench_socket(count: int) -> float:
+    updates = make_updates(count)
+    reader, writer = socket.socketpair()
+
+    def push():
+        for update in updates:
+            writer.sendall(update)
+        writer.close()
+
+    pusher = threading.Thread(target=push)
+    decoder = StreamDecoder()
+    messages = []
+
+    start = perf_counter()
+    pusher.start()
+    while received := reader.recv(BUFFER_SIZE):
+        for message in decoder.feed(received):
+            messages.append(message)
+            json.loads(message)
+    elapsed = perf_counter() - start
+
+    pusher.join()
+    reader.close()
+    check(messages, count)
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Stream decoder throughput benchmark")
+    parser.add_argument("--count", type=int, default=200000, help="updates pushed per run")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    print(f"in-memory, random read sizes: {bench_in_memory(arguments.count, arguments.seed):,.0f} updates/s")
+    print(f"socket pair, decode + parse:  {bench_socket(arguments.count):,.0f} updates/s")
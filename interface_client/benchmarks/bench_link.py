@@ -0,0 +1,68 @@
+# bench_link.py
+# Command throughput over an impaired link: one at a time, pipelined, and cached, against a local stand-in server
+# Run from the interface_client folder: python benchmarks/bench_link.py [--latency 0.02] [--loss 0.01]
+
+import asyncio
+import sys
+import threading
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import remote_interface
+from impairment import Impairment, ImpairmentProxy, SOFT_AP_CONDITIONS
+from server import RemoteServer
+
+SERVER_PORTS = (56555, 56055)  # The proxy takes the usual ports, where the client connects
+
+
+def sequential(interface, count: int) -> list[dict]:
+    return [interface.execute("get_bridge_position") for _ in range(count)]
+
+
+def pipelined(interface, count: int) -> list[dict]:
+    return interface.execute_many([("get_bridge_position", None)] * count)
+
+
+def cached(interface, count: int) -> list[dict]:
+    interface.enable_cache(ttls={"get_bridge_position": 0.1})
+    try:
+        return sequential(interface, count)
+    finally:
+        interface.response_cache = None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Impaired link benchmark")
+    parser.add_argument("--count", type=int, default=100, help="commands per run")
+    parser.add_argument("--seed", type=int, default=1)
+    for condition, value in SOFT_AP_CONDITIONS.items():
+        parser.add_argument(f"--{condition.replace('_', '-')}", type=float, default=value)
+    arguments = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    server = RemoteServer("127.0.0.1", *SERVER_PORTS)
+    server.handlers["get_bridge_position"] = lambda kwargs: {"response": "DATA", "payload": {"position": 0.0}}
+    impairment = Impairment(arguments.latency, arguments.jitter, arguments.loss, arguments.reorder,
+                            arguments.bandwidth, arguments.poll_delay, seed=arguments.seed)
+    proxy = ImpairmentProxy(impairment, "127.0.0.1", *SERVER_PORTS)
+    for service in [server, proxy]:
+        asyncio.run_coroutine_threadsafe(service.start(), loop).result()
+
+    interface = remote_interface.RemoteInterface("127.0.0.1", ping_interval=0, timeout=1.0)
+    print(f"{'mode':<12}{'commands/s':>12}{'timeouts':>10}")
+    for mode in [sequential, pipelined, cached]:
+        start = perf_counter()
+        responses = mode(interface, arguments.count)
+        elapsed = perf_counter() - start
+        timeouts = sum(response.get("error_code") == remote_interface.error_code["TIMEOUT"] for response in responses)
+        print(f"{mode.__name__:<12}{arguments.count / elapsed:>12.1f}{timeouts:>10}")
+
+    interface.quit()
+    for service in [proxy, server]:
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+    print(f"\n{impairment.lost} messages lost, {impairment.reordered} reordered")
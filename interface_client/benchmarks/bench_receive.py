@@ -0,0 +1,104 @@
+# bench_receive.py
+# Memory allocated per update by the receive path: recv() then feed(), against recv_into() and in-place messages
+# Run from the interface_client folder: python benchmarks/bench_receive.py
+
+import io
+import json
+import socket
+import sys
+import threading
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from framing import StreamDecoder
+from remote_interface import BUFFER_SIZE
+from wire_codec import decode_frame
+
+
+def make_stream(count: int) -> bytes:
+    return b"".join(
+        json.dumps({"current_position": round((index % 1000) / 1000.0, 3), "bridge_lights": "STOP"}).encode() + b"\r\n"
+        for index in range(count)
+    )
+
+
+class StreamSocket:  # Serves a byte stream the way a socket would, so only the client's side is measured
+    def __init__(self, stream: bytes):
+        self._stream = io.BytesIO(stream)
+
+    def recv(self, size: int) -> bytes:
+        return self._stream.read(size)
+
+    def recv_into(self, buffer: memoryview) -> int:
+        return self._stream.readinto(buffer)
+
+
+def read_copying(connection, decoder: StreamDecoder, decode: bool) -> int:
+    # How RemoteInterface read before: a new bytes object per read, then one per message
+    count = 0
+    while received := connection.recv(BUFFER_SIZE):
+        for message in decoder.feed(received):
+            if decode:
+                decode_frame(message)
+            count += 1
+    return count
+
+
+def read_in_place(connection, decoder: StreamDecoder, decode: bool) -> int:
+    count = 0
+    while decoder.receive(connection, BUFFER_SIZE):
+        for message in decoder.messages():
+            if decode:
+                decode_frame(message)
+            count += 1
+    return count
+
+
+def allocations(reader, stream: bytes, decode: bool) -> tuple[int, float]:
+    # Peak bytes allocated above the steady state, which is what one read's temporaries cost at most,
+    # and the bytes per update still held afterwards
+    # A warm-up pass first, so the decoder's buffer and the interpreter's caches already exist
+    decoder = StreamDecoder()
+    reader(StreamSocket(stream[:len(stream) // 10]), decoder, decode)
+
+    connection = StreamSocket(stream)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    count = reader(connection, decoder, decode)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - before, (after - before) / count
+
+
+def throughput(reader, stream: bytes) -> float:
+    receiving, sending = socket.socketpair()
+    pusher = threading.Thread(target=lambda: (sending.sendall(stream), sending.close()))
+
+    start = perf_counter()
+    pusher.start()
+    count = reader(receiving, StreamDecoder(), True)
+    elapsed = perf_counter() - start
+
+    pusher.join()
+    receiving.close()
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Receive path allocation benchmark")
+    parser.add_argument("--count", type=int, default=100000, help="updates per run")
+    arguments = parser.parse_args()
+
+    stream = make_stream(arguments.count)
+    readers = {"recv + feed": read_copying, "recv_into + messages": read_in_place}
+
+    print(f"{'path':<24}{'peak framing B':>16}{'with decode':>13}{'retained B/update':>19}{'updates/s':>12}")
+    for name, reader in readers.items():
+        framing_peak, _ = allocations(reader, stream, False)
+        decode_peak, retained = allocations(reader, stream, True)
+        rate = throughput(reader, stream)
+        print(f"{name:<24}{framing_peak:>16}{decode_peak:>13}{retained:>19.2f}{rate:>12,.0f}")
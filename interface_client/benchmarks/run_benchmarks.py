@@ -0,0 +1,285 @@
+# run_benchmarks.py
+# Headless microbenchmarks of the client's hot paths, saved as JSON so runs on different commits can be compared
+# Run from the interface_client folder: python benchmarks/run_benchmarks.py [--output results.json] [--compare old.json]
+
+import io
+import json
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from timeit import Timer
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fleet_simulation import SimulatedFleet, numpy
+from framing import StreamDecoder
+from remote_interface import encode_command, decode_response
+from shell import parse_input, print_payload
+from update_router import UpdateRouter
+from simulation import event_simulation, event_simulations, SimulatedInterface, SIMULATION_TICK_TIME
+from traffic_simulation import TrafficSimulatedInterface, BridgeOperator
+from wire_codec import codecs, decode_frame, JSON_CODEC, BINARY_CODEC
+
+try:
+    # Imported for their geometry and lookup code only; no window is ever opened
+    from bridge_display import draw_box, draw_bridge_3d
+    from monitor import TableMonitor
+except ImportError:  # Python built without Tk
+    draw_box = draw_bridge_3d = TableMonitor = None
+
+DEFAULT_OUTPUT = Path(__file__).resolve().parent / "bench_results.json"  # Next to this script, wherever it is run from
+
+cases: dict[str, Callable[[], Callable[[], object]]] = {}  # Name: setup returning the function to time
+
+
+def case(name: str):
+    def register(setup: Callable[[], Callable[[], object]]):
+        cases[name] = setup
+        return setup
+    return register
+
+
+class FakeCanvas:  # Stands in for a Tk canvas, keeping only the count of shapes drawn
+    def __init__(self):
+        self.shapes = 0
+
+    def create_polygon(self, *args, **kwargs) -> int:
+        self.shapes += 1
+        return self.shapes
+
+    def create_line(self, *args, **kwargs) -> int:
+        self.shapes += 1
+        return self.shapes
+
+
+class FakeLabel:
+    def __init__(self, text: str):
+        self.text = text
+
+    def cget(self, option: str) -> str:
+        return self.text
+
+    def config(self, text: str = None) -> None:
+        self.text = text
+
+
+class FakeRow:  # Shaped like monitor.InfoPair as far as Table.assign looks
+    def __init__(self, key: str, value: str):
+        self.label_key = FakeLabel(key)
+        self.label_value = FakeLabel(value)
+
+
+class FakeTable:
+    def __init__(self, keys: list[str]):
+        self.rows = [FakeRow(key.replace("_", " ").title(), "") for key in keys]
+
+
+@case("encode_command json")
+def encode_json():
+    codec = codecs[JSON_CODEC]
+    return lambda: encode_command("set_bridge_position", {"position": 0.5}, 1024, codec)
+
+
+@case("encode_command json undeclared")
+def encode_json_undeclared():
+    # A command missing from the registry, so always encoded from a whole dictionary
+    codec = codecs[JSON_CODEC]
+    return lambda: encode_command("set_bridge_speed", {"speed": 0.5}, 1024, codec)
+
+
+@case("encode_command msgpack")
+def encode_binary():
+    codec = codecs[BINARY_CODEC]
+    return lambda: encode_command("set_bridge_position", {"position": 0.5}, 1024, codec)
+
+
+@case("decode_response")
+def decode_one_response():
+    message = b'{"response": "DATA", "payload": {"position": 0.25, "lights": "STOP"}, "ticket": 1024}'
+    return lambda: decode_response(message)
+
+
+@case("decode 64 updates from one read")
+def decode_update_burst():
+    burst = b"".join(
+        json.dumps({"current_position": index / 64, "bridge_lights": "STOP"}).encode() + b"\r\n" for index in range(64)
+    )
+
+    def decode_burst():
+        return [decode_frame(message) for message in StreamDecoder().feed(burst)]
+
+    return decode_burst
+
+
+@case("shell.parse_input")
+def parse_command_line():
+    return lambda: parse_input("set_overrides enabled = true bridge=open  waterway= 0.5 lights=on")
+
+
+@case("shell.print_payload")
+def print_six_keys():
+    payload = {"position": 0.25, "target_position": 1.0, "lights": "STOP", "overrides": False,
+               "bridge_traffic": 3, "waterway_traffic": 0}
+    sink = io.StringIO()
+
+    def print_to_sink():
+        sink.seek(0)
+        sink.truncate()
+        with redirect_stdout(sink):
+            print_payload(payload)
+
+    return print_to_sink
+
+
+@case("Table.assign over 16 rows")
+def assign_existing_key():
+    if TableMonitor is None:
+        return None
+    keys = [f"sensor_{index}" for index in range(15)] + ["current_position"]
+    table = FakeTable(keys)
+    return lambda: TableMonitor.Table.assign(table, "current_position", 0.5)
+
+
+@case("route 16 keys to 8 subscribers")
+def route_update():
+    # One subscriber wants everything and the rest one key each, as the host's monitors would
+    keys = [f"sensor_{index}" for index in range(15)] + ["current_position"]
+    router = UpdateRouter()
+    router.subscribe(lambda update: None)
+    for key in keys[-7:]:
+        router.subscribe(lambda update: None, keys=[key])
+    update = {key: index for index, key in enumerate(keys)}
+    return lambda: router.dispatch(update)
+
+
+@case("draw_box")
+def draw_one_box():
+    if draw_box is None:
+        return None
+    canvas = FakeCanvas()
+    return lambda: draw_box(canvas, (175, 250), (50, 200, 50), 30, outline="lime", fill="black", width=3)
+
+
+@case("draw_bridge_3d")
+def draw_whole_bridge():
+    if draw_bridge_3d is None:
+        return None
+    canvas = FakeCanvas()
+    return lambda: draw_bridge_3d(canvas, 0.5)
+
+
+@case("event_simulation one tick")
+def simulate_tick():
+    return lambda: event_simulation(SIMULATION_TICK_TIME, 0.5)
+
+
+@case("event_simulation one second")
+def simulate_second():
+    return lambda: event_simulation(1.0, 0.5)
+
+
+@case("event_simulation one hour")
+def simulate_hour():
+    return lambda: event_simulation(3600.0, 0.5)
+
+
+@case("event_simulations 1000 pairs")
+def simulate_batch():
+    times = [SIMULATION_TICK_TIME * (index % 100 + 1) for index in range(1000)]
+    return lambda: event_simulations(times, 0.5)
+
+
+@case("SimulatedInterface ten minutes")
+def simulate_scenario():
+    def run_scenario():
+        simulation = SimulatedInterface(seed=0, start=False)
+        simulation.overrides_enabled = True
+        simulation.bridge_target_position = 1.0
+        simulation.run_for(600.0)
+
+    return run_scenario
+
+
+@case("traffic one simulated day")
+def simulate_traffic_day():
+    def run_day():
+        simulation = TrafficSimulatedInterface(seed=0, start=False)
+        BridgeOperator(simulation)
+        simulation.run_for(86400.0)
+
+    return run_day
+
+
+@case("SimulatedFleet 10k one frame")
+def simulate_fleet_frame():
+    if numpy is None:
+        return None
+    fleet = SimulatedFleet(10000, seed=0, start=False)
+    fleet.overrides[:] = True
+    fleet.targets[:] = fleet.random.random(len(fleet))
+    return fleet.step
+
+
+def per_call(function: Callable[[], object], repeat: int) -> tuple[float, int]:
+    # Best of several runs, in nanoseconds, and the number of calls in each run
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9, number
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    print(f"\nAgainst {baseline_path}:")
+    for name, result in results.items():
+        if name in baseline:
+            change = result["ns_per_call"] / baseline[name]["ns_per_call"] - 1.0
+            print(f"{name:<34}{change:>+10.1%}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Client hot path benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="Earlier results to report the change against")
+    parser.add_argument("--only", nargs="*", help="Run only the benchmarks whose names contain one of these")
+    arguments = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':<34}{'ns/call':>12}{'calls':>10}")
+    for name, setup in cases.items():
+        if arguments.only and not any(part in name for part in arguments.only):
+            continue
+        function = setup()
+        if function is None:
+            print(f"{name:<34}{'skipped':>12}")
+            continue
+
+        nanoseconds, number = per_call(function, arguments.repeat)
+        results[name] = {"ns_per_call": nanoseconds, "calls": number, "repeat": arguments.repeat}
+        print(f"{name:<34}{nanoseconds:>12.0f}{number:>10}")
+
+    report = {
+        "commit": commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    Path(arguments.output).write_text(json.dumps(report, indent=2))
+    print(f"\nSaved to {arguments.output}")
+
+    if arguments.compare:
+        compare(results, arguments.compare)
@@ -0,0 +1,191 @@
+# async_remote_interface.py
+# The remote interface on asyncio streams, for tools that run many connections in one event loop
+
+import asyncio
+from functools import partial
+from time import perf_counter as check_timer
+from typing import AsyncIterator
+
+from framing import StreamDecoder
+from wire_codec import decode_frame
+from remote_interface import RemoteInterfaceHeader, UpdateReceiver, CommandBatch, PendingCommands
+from remote_interface import BUFFER_SIZE, COMMANDER_PORT, UPDATER_PORT, DEFAULT_TIMEOUT
+from remote_interface import call_receiver, decode_response, encode_command, error_response
+
+
+class AsyncRemoteInterface(RemoteInterfaceHeader):
+    _times_own_commands = True
+
+    def __init__(self, host: str = "192.168.4.1", update_receiver: UpdateReceiver = None,
+                 timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(update_receiver)
+        self.host = host
+        self.timeout = timeout
+
+        self._commander_reader: asyncio.StreamReader = None
+        self._commander_writer: asyncio.StreamWriter = None
+        self._updater_reader: asyncio.StreamReader = None
+        self._updater_writer: asyncio.StreamWriter = None
+
+        self._pending = PendingCommands()
+        self._update_queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "AsyncRemoteInterface":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exception_info) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        self._commander_reader, self._commander_writer = await asyncio.open_connection(self.host, COMMANDER_PORT)
+        self._updater_reader, self._updater_writer = await asyncio.open_connection(self.host, UPDATER_PORT)
+
+        self._receiving_updates = True
+        self._tasks = [
+            asyncio.create_task(self._commander_worker()),
+            asyncio.create_task(self._update_worker()),
+        ]
+
+    async def execute(self, command_name: str, **kwargs) -> dict:
+        return await self.execute_within(self.timeout, command_name, **kwargs)
+
+    async def execute_within(self, timeout: float, command_name: str, **kwargs) -> dict:
+        # As execute, but answers with a TIMEOUT error if no response arrives within the given number of seconds
+        cached, token = self._cache_lookup(command_name, kwargs)
+        if cached is not None:
+            return cached
+
+        response = (await self._gather(self.submit_many([(command_name, kwargs)]), timeout))[0]
+        self._cache_store(token, response)
+        return response
+
+    async def execute_many(self, commands: CommandBatch) -> list[dict]:
+        return await self._gather(self.submit_many(commands), self.timeout)
+
+    def submit(self, command_name: str, kwargs: dict = None) -> asyncio.Future:
+        # Dispatches a command without waiting on its response; any number of commands may be in flight at once
+        return self.submit_many([(command_name, kwargs)])[0]
+
+    def submit_many(self, commands: CommandBatch) -> list[asyncio.Future]:
+        # Serializes the whole batch into a single write so it costs one round trip
+        if self._commander_writer is None:
+            raise ConnectionError("Interface is not connected")
+
+        loop = asyncio.get_running_loop()
+        submitted = check_timer()
+        commands = list(commands)
+        futures = [loop.create_future() for _ in commands]
+        batch, tickets, unencodable = self._pending.encode_batch(
+            (future, partial(encode_command, command_name, kwargs))
+            for future, (command_name, kwargs) in zip(futures, commands)
+        )
+        for future, ticket, (command_name, _) in zip(futures, tickets, commands):
+            future.add_done_callback(lambda done, ticket=ticket: self._forget(ticket, done))
+            future.add_done_callback(
+                lambda done, command_name=command_name: self._record_result(command_name, submitted, done)
+            )
+        for future, exception in unencodable:
+            future.set_exception(exception)
+
+        self._commander_writer.write(batch)
+        self.metrics.count_sent(len(batch))
+        return futures
+
+    async def updates(self) -> AsyncIterator[dict]:
+        # Every iterator sees every update received while it is open; once updates have ended, none at all
+        if not self._receiving_updates:
+            return
+        queue = asyncio.Queue()
+        self._update_queues.append(queue)
+        try:
+            while (update := await queue.get()) is not None:
+                yield update
+        finally:
+            self._update_queues.remove(queue)
+
+    def quit(self) -> None:
+        self._receiving_updates = False
+        for task in self._tasks:
+            task.cancel()
+        for writer in [self._commander_writer, self._updater_writer]:
+            if writer is not None:
+                writer.close()
+
+        self._end_updates()
+        self._fail_pending(ConnectionError("Interface closed"))
+
+    async def close(self) -> None:
+        self.quit()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for writer in [self._commander_writer, self._updater_writer]:
+            if writer is not None:
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    @staticmethod
+    async def _gather(futures: list[asyncio.Future], timeout: float) -> list[dict]:
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+        responses = []
+        for future in futures:
+            if not future.done():
+                future.set_result(error_response("TIMEOUT"))
+            responses.append(future.result())
+        return responses
+
+    def _forget(self, ticket: int, future: asyncio.Future) -> None:
+        # Stops tracking a command cancelled or timed out locally so a late response is ignored
+        if self._pending.get(ticket) is future:
+            self._pending.discard(ticket)
+
+    def _fail_pending(self, exception: Exception) -> None:
+        for future in self._pending.clear():
+            if not future.done():
+                future.set_exception(exception)
+
+    def _end_updates(self) -> None:
+        for queue in self._update_queues:
+            queue.put_nowait(None)
+
+    async def _commander_worker(self) -> None:
+        # However the connection ends, nothing is left waiting on it
+        decoder = StreamDecoder()
+        try:
+            while received := await self._commander_reader.read(BUFFER_SIZE):
+                self.metrics.count_received(len(received))
+                for message in decoder.feed(received):
+                    response = decode_response(message)
+                    future = self._pending.resolve(response)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+        except OSError:
+            pass  # Reset or otherwise broken, which ends it as closing would
+        finally:
+            self._fail_pending(ConnectionError("Commander connection closed"))
+
+    async def _update_worker(self) -> None:
+        decoder = StreamDecoder()
+        try:
+            while received := await self._updater_reader.read(BUFFER_SIZE):
+                self.metrics.count_received(len(received))
+                for message in decoder.feed(received):
+                    try:
+                        update = decode_frame(message)
+                    except ValueError:
+                        continue
+                    if not isinstance(update, dict):
+                        continue  # Valid, but not an update
+
+                    call_receiver(self._send_update, update)
+                    for queue in self._update_queues:
+                        queue.put_nowait(update)
+        except OSError:
+            pass  # Reset or otherwise broken, which ends it as closing would
+        finally:
+            self._receiving_updates = False
+            self._end_updates()
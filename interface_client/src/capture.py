@@ -0,0 +1,105 @@
+# capture.py
+# An append-only binary log of wire traffic, for reproducing incidents and replaying real traffic later
+# Each record is a fixed header of (monotonic nanoseconds, kind, length) followed by one message as framed on the wire,
+# less the delimiter of text messages. Every writer starts a session with a SESSION record, as monotonic time only
+# compares within one run of one boot
+
+import struct
+import threading
+from pathlib import Path
+from time import monotonic_ns, time_ns
+from typing import BinaryIO, Iterator, NamedTuple
+
+from framing import MESSAGE_DELIMITER, BINARY_FRAME_MARKER
+
+CAPTURE_MAGIC = b"RICAP\x01"  # Identifies a capture file and its format version
+RECORD_HEADER = struct.Struct("<QBI")
+SESSION_MARKER = struct.Struct("<Q")  # A session's message: the wall clock nanoseconds it started at
+
+# Record kinds
+SESSION = 0  # Starts the records of one writer, which may be appended after those of another run
+COMMAND = 1  # Sent to the commander port
+RESPONSE = 2  # Received on the commander port
+UPDATE = 3  # Received on the updater port
+UPDATER_COMMAND = 4  # Sent to the updater port, which only ever asks for the updates' codec
+
+kind_names = {SESSION: "session", COMMAND: "command", RESPONSE: "response", UPDATE: "update", UPDATER_COMMAND: "updater command"}
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: int  # time.monotonic_ns() when the message was sent or received
+    kind: int
+    message: bytes
+
+
+def unframe(frame: bytes) -> bytes:
+    # Binary frames are kept whole, as a trailing newline byte may belong to their payload
+    if frame[:1] != bytes((BINARY_FRAME_MARKER,)) and frame.endswith(MESSAGE_DELIMITER):
+        return frame[:-len(MESSAGE_DELIMITER)]
+    return frame
+
+
+def reframe(message: bytes) -> bytes:
+    # The message as it would be written to a socket
+    if message[:1] == bytes((BINARY_FRAME_MARKER,)):
+        return message
+    return message + MESSAGE_DELIMITER
+
+
+class CaptureWriter:
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.records = 0
+        self._lock = threading.Lock()
+
+        # Appending to an earlier capture keeps its records; only a new file gets the magic
+        self._file: BinaryIO = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_MAGIC)
+        elif read_magic(self.path) != CAPTURE_MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a capture file")
+        self.record(SESSION, SESSION_MARKER.pack(time_ns()))
+
+    def record(self, kind: int, message: bytes) -> None:
+        header = RECORD_HEADER.pack(monotonic_ns(), kind, len(message))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(header)
+            self._file.write(message)
+            self.records += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.close()
+
+
+def read_magic(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read(len(CAPTURE_MAGIC))
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    # A record cut short by a crash ends the capture rather than raising
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+
+        while len(header := file.read(RECORD_HEADER.size)) == RECORD_HEADER.size:
+            timestamp, kind, length = RECORD_HEADER.unpack(header)
+            message = file.read(length)
+            if len(message) < length:
+                return
+            yield CaptureRecord(timestamp, kind, message)
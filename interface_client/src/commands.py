@@ -0,0 +1,179 @@
+# commands.py
+# Every command the controllers understand, declared once with its argument types
+# Interfaces expose them as stubs, e.g. ri.commands.set_bridge_position(position=0.5), which check their arguments
+# before anything is sent, and JSON commands can be written from pre-encoded templates instead of whole dictionaries
+
+import inspect
+from math import isfinite
+from typing import Any, Callable, Iterator, NamedTuple
+
+from wire_codec import dump_json, JSON_LIBRARY
+
+# orjson encodes a whole command faster than Python can fill in a template; the other libraries are several times slower
+USE_TEMPLATES = JSON_LIBRARY != "orjson"
+
+
+class Argument(NamedTuple):
+    name: str
+    types: tuple[type, ...]
+    required: bool = True
+
+
+class CommandSpec:
+    def __init__(self, name: str, arguments: list[Argument], description: str = ""):
+        self.name = name
+        self.arguments = {argument.name: argument for argument in arguments}
+        self.description = description
+        self._required = frozenset(argument.name for argument in arguments if argument.required)
+
+        # Everything up to the first argument, and each argument's key, already encoded
+        self._head = dump_json(name).join([b'{"command":', b',"kwargs":{'])
+        self._keys = {argument.name: self._key(argument.name) for argument in arguments}
+
+    def __repr__(self) -> str:
+        return f"CommandSpec({self.name}{self.signature()})"
+
+    def signature(self) -> inspect.Signature:
+        return inspect.Signature([
+            inspect.Parameter(argument.name, inspect.Parameter.KEYWORD_ONLY,
+                              default=inspect.Parameter.empty if argument.required else None,
+                              annotation=argument.types[0] if len(argument.types) == 1 else argument.types)
+            for argument in self.arguments.values()
+        ])
+
+    def validate(self, kwargs: dict) -> str:
+        # What is wrong with the arguments, or None if the server should accept them
+        for key, value in kwargs.items():
+            argument = self.arguments.get(key)
+            if argument is None:
+                return f"{self.name} takes no argument '{key}'"
+            if not _matches(value, argument.types):
+                expected = " or ".join(kind.__name__ for kind in argument.types)
+                return f"{self.name} needs {expected} for '{key}', not {type(value).__name__}"
+
+        if not self._required <= kwargs.keys():
+            missing = ", ".join(sorted(self._required - kwargs.keys()))
+            return f"{self.name} is missing {missing}"
+        return None
+
+    def encode(self, kwargs: dict, ticket: int = 0) -> bytes:
+        # The same JSON line encode_command would produce, built from the templates
+        # Every declared command takes at most one argument, so those cases skip the general join
+        if not kwargs:
+            return b'%s},"ticket":%d}\n' % (self._head, ticket)
+
+        keys = self._keys
+        if len(kwargs) == 1:
+            [(key, value)] = kwargs.items()
+            encoded_key = keys.get(key) or self._key(key)
+            return b'%s%s%s},"ticket":%d}\n' % (self._head, encoded_key, _encode_value(value), ticket)
+
+        body = b",".join([(keys.get(key) or self._key(key)) + _encode_value(value) for key, value in kwargs.items()])
+        return b'%s%s},"ticket":%d}\n' % (self._head, body, ticket)
+
+    @staticmethod
+    def _key(key: str) -> bytes:
+        return dump_json(key) + b":"
+
+
+def _encode_value(value: Any) -> bytes:
+    # Scalars written directly, as the JSON libraries would write them
+    kind = type(value)
+    if kind is float:
+        if isfinite(value):
+            return b"%r" % value
+    elif kind is bool:
+        return b"true" if value else b"false"
+    elif kind is int:
+        return b"%d" % value
+    return dump_json(value)
+
+
+def _matches(value: Any, types: tuple[type, ...]) -> bool:
+    if isinstance(value, bool):
+        return bool in types  # Otherwise accepted as an int
+    if isinstance(value, int) and float in types:
+        return True
+    return isinstance(value, types)
+
+
+class CommandRegistry:
+    def __init__(self):
+        self._specs: dict[str, CommandSpec] = {}
+
+    def __contains__(self, command_name: str) -> bool:
+        return command_name in self._specs
+
+    def __iter__(self) -> Iterator[CommandSpec]:
+        return iter(self._specs.values())
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def define(self, name: str, description: str = "", optional: tuple[str, ...] = (),
+               **argument_types: type | tuple[type, ...]) -> CommandSpec:
+        # e.g. define("set_bridge_position", position=float); arguments named in optional may be left out
+        arguments = [
+            Argument(argument, types if isinstance(types, tuple) else (types,), argument not in optional)
+            for argument, types in argument_types.items()
+        ]
+        spec = self._specs[name] = CommandSpec(name, arguments, description)
+        return spec
+
+    def get(self, command_name: str) -> CommandSpec:
+        return self._specs.get(command_name)
+
+
+class BoundCommands:  # The stubs of a registry's commands, bound to one interface
+    def __init__(self, interface: Any, registry: CommandRegistry):
+        self._interface = interface
+        self._registry = registry
+
+    def __dir__(self) -> list[str]:
+        return [spec.name for spec in self._registry]
+
+    def __getattr__(self, command_name: str) -> Callable[..., Any]:
+        spec = self._registry.get(command_name)
+        if spec is None:
+            raise AttributeError(f"No command named '{command_name}'")
+
+        stub = _make_stub(self._interface, spec)
+        setattr(self, command_name, stub)  # Found directly from then on
+        return stub
+
+
+def _make_stub(interface: Any, spec: CommandSpec) -> Callable[..., Any]:
+    # Rejected calls answer with INVALID_ARGS straight away; awaitable for interfaces whose execute is
+    if inspect.iscoroutinefunction(interface.execute):
+        async def stub(**kwargs) -> dict:
+            problem = spec.validate(kwargs)
+            if problem is not None:
+                return interface._reject(spec.name, problem)
+            return await interface.execute(spec.name, **kwargs)
+    else:
+        def stub(**kwargs) -> dict:
+            problem = spec.validate(kwargs)
+            if problem is not None:
+                return interface._reject(spec.name, problem)
+            return interface.execute(spec.name, **kwargs)
+
+    stub.__name__ = stub.__qualname__ = spec.name
+    stub.__doc__ = spec.description or None
+    stub.__signature__ = spec.signature()
+    return stub
+
+
+# The commands of the ESP32 firmware and the simulated controller
+command_registry = CommandRegistry()
+command_registry.define("ping", "Answers OK; used as a health check")
+command_registry.define("echo", "Answers with the given message", message=str)
+command_registry.define("raise_error", "Answers with the given error code", optional=("code",), code=int)
+command_registry.define("set_overrides", "Enables or disables manual overrides", to=bool)
+command_registry.define("set_bridge_position", "Moves the bridge towards a position from 0 to 1", position=float)
+command_registry.define("get_bridge_position", "Answers with the bridge's current position")
+command_registry.define("set_light_condition", "Sets the traffic lights while overrides are enabled",
+                        light_condition=str)
+command_registry.define("get_light_condition", "Answers with the traffic lights' condition")
+command_registry.define("negotiate_codec", "Agrees on the wire encoding", codecs=list)
+command_registry.define("negotiate_transport", "Agrees on whether updates share the commander connection",
+                        transports=list)
@@ -0,0 +1,397 @@
+# fleet.py
+# Many bridge controllers served by a single selector thread, however large the fleet grows
+
+import selectors
+import socket
+import threading
+from concurrent.futures import Future, InvalidStateError
+from functools import partial
+from typing import Callable, Any, Iterable
+
+from framing import StreamDecoder
+from wire_codec import decode_frame
+from update_queue import UpdateQueue, UPDATE_QUEUE_SIZE, BLOCK
+from remote_interface import RemoteInterfaceHeader, UpdateReceiver, CommandBatch, PendingCommands
+from remote_interface import BUFFER_SIZE, COMMANDER_PORT, UPDATER_PORT, DEFAULT_TIMEOUT, error_code
+from remote_interface import call_receiver, decode_response, encode_command, deadline_after, settle, wait_for_response
+
+FleetUpdateReceiver: type = Callable[[str, dict], Any]
+
+
+class Controller:  # Connection state of one controller in the fleet
+    def __init__(self, name: str, host: str):
+        self.name = name
+        self.host = host
+
+        self.commander_socket = socket.create_connection((host, COMMANDER_PORT))
+        self.updater_socket = socket.create_connection((host, UPDATER_PORT))
+        for connection in [self.commander_socket, self.updater_socket]:
+            connection.setblocking(False)
+
+        self.commander_decoder = StreamDecoder()
+        self.updater_decoder = StreamDecoder()
+        self.pending = PendingCommands()
+        self.outbox = bytearray()
+        self.connected = True
+
+    def close(self) -> None:
+        self.connected = False
+        for connection in [self.commander_socket, self.updater_socket]:
+            connection.close()
+
+
+class FleetMember(RemoteInterfaceHeader):  # One controller of a fleet, usable wherever a single interface is expected
+    def __init__(self, fleet: "RemoteInterfaceFleet", name: str, update_receiver: UpdateReceiver = None):
+        super().__init__(update_receiver)
+        self.fleet = fleet
+        self.name = name
+        self._receiving_updates = True
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        future = self.fleet.submit(command_name, kwargs, targets=[self.name])[self.name]
+        return wait_for_response(future, deadline_after(self.fleet.timeout))
+
+    def execute_many(self, commands: CommandBatch) -> list[dict]:
+        deadline = deadline_after(self.fleet.timeout)
+        futures = self.fleet.submit_many(commands, targets=[self.name])[self.name]
+        return [wait_for_response(future, deadline) for future in futures]
+
+    def quit(self) -> None:
+        self.fleet.remove(self.name)
+
+
+class RemoteInterfaceFleet:
+    def __init__(self, hosts: dict[str, str], update_receiver: FleetUpdateReceiver = None,
+                 update_queue_size: int = UPDATE_QUEUE_SIZE, overflow_policy: str = BLOCK,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.update_receiver = update_receiver
+        self.timeout = timeout  # Seconds execute waits for each controller's response; None waits forever
+
+        # Updates are queued as (controller name, update) and handed to receivers off the I/O thread
+        self.update_queue = UpdateQueue(update_queue_size, overflow_policy)
+
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._controllers: dict[str, Controller] = {}
+        self._members: dict[str, FleetMember] = {}
+        self._io_calls: list[Callable[[], Any]] = []  # Selector changes requested by other threads
+
+        # The I/O thread never waits on a full BLOCK queue; it stops reading updates instead, which pushes back on
+        # the controllers through TCP, until the dispatcher has worked the queue down to half
+        self._paused: list[Controller] = []
+        self._resume_requested = False
+
+        # Other threads queue commands then poke the wake socket so the selector picks them up
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ)
+
+        for name, host in hosts.items():
+            self.add(name, host)
+
+        self._running = True
+        self.io_thread = threading.Thread(target=self._io_worker, daemon=True)
+        self.io_thread.start()
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_worker, daemon=True)
+        self.dispatcher_thread.start()
+
+    def __getitem__(self, name: str) -> FleetMember:
+        return self._members[name]
+
+    def __iter__(self):
+        return iter(list(self._members))
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, name: str, host: str) -> FleetMember:
+        controller = Controller(name, host)
+        with self._lock:
+            if name in self._controllers:
+                controller.close()
+                raise KeyError(f"Controller '{name}' is already in the fleet")
+
+            self._controllers[name] = controller
+            member = self._members[name] = FleetMember(self, name)
+            self._io_calls.append(lambda: self._register(controller))
+
+        self._wake()
+        return member
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            controller = self._controllers.pop(name, None)
+            self._members.pop(name, None)
+            if controller is not None:
+                exception = ConnectionError(f"Controller '{name}' removed from fleet")
+                self._io_calls.append(lambda: self._disconnect(controller, exception))
+
+        self._wake()
+
+    def execute(self, command_name: str, **kwargs) -> dict[str, dict]:
+        return self.execute_on(None, command_name, **kwargs)
+
+    def execute_on(self, targets: Iterable[str], command_name: str, **kwargs) -> dict[str, dict]:
+        # Fans the command out to the targets (every controller when None) and gathers a response from each
+        deadline = deadline_after(self.timeout)
+        futures = self.submit(command_name, kwargs, targets)
+        return {name: self._result_of(future, deadline) for name, future in futures.items()}
+
+    def execute_many(self, commands: CommandBatch, targets: Iterable[str] = None) -> dict[str, list[dict]]:
+        deadline = deadline_after(self.timeout)
+        batches = self.submit_many(commands, targets)
+        return {name: [self._result_of(future, deadline) for future in futures] for name, futures in batches.items()}
+
+    def submit(self, command_name: str, kwargs: dict = None, targets: Iterable[str] = None) -> dict[str, Future]:
+        batches = self.submit_many([(command_name, kwargs)], targets)
+        return {name: futures[0] for name, futures in batches.items()}
+
+    def submit_many(self, commands: CommandBatch, targets: Iterable[str] = None) -> dict[str, list[Future]]:
+        commands = list(commands)
+        batches = {}
+        tickets = []
+        unencodable = []
+
+        with self._lock:
+            names = list(self._controllers) if targets is None else list(targets)
+            for name in names:
+                controller = self._controllers.get(name)
+                if controller is None:
+                    raise KeyError(f"No controller named '{name}' in the fleet")
+
+                futures = [Future() for _ in commands]
+                if controller.connected:
+                    batch, sent, failed = controller.pending.encode_batch(
+                        (future, partial(encode_command, command_name, kwargs))
+                        for future, (command_name, kwargs) in zip(futures, commands)
+                    )
+                    controller.outbox += batch
+                    tickets += [(controller, future, ticket) for future, ticket in zip(futures, sent) if ticket]
+                    unencodable += failed
+                else:
+                    exception = ConnectionError(f"Controller '{name}' is disconnected")
+                    unencodable += [(future, exception) for future in futures]
+                batches[name] = futures
+
+        # Outside the lock, as the futures' callbacks may submit more, and forgetting takes it
+        for controller, future, ticket in tickets:
+            future.add_done_callback(lambda done, controller=controller, ticket=ticket:
+                                     self._forget(controller, ticket, done))
+        for future, exception in unencodable:
+            future.set_exception(exception)
+
+        self._wake()
+        return batches
+
+    def quit(self) -> None:
+        self._running = False
+        self._wake()
+        self.io_thread.join()
+        self._run_io_calls()
+        self.update_queue.close()
+
+        with self._lock:
+            controllers = list(self._controllers.values())
+            self._controllers.clear()
+            self._members.clear()
+        for controller in controllers:
+            self._fail_pending(controller, ConnectionError("Fleet closed"))
+            controller.close()
+
+        self._selector.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
+
+    @staticmethod
+    def _result_of(future: Future, deadline: float) -> dict:
+        # One unreachable or silent controller should not hide the responses of the rest
+        try:
+            return wait_for_response(future, deadline)
+        except ConnectionError as exception:
+            return {"response": "ERR", "error_code": error_code["UNSPECIFIED"], "source": str(exception)}
+
+    def _forget(self, controller: Controller, ticket: int, future: Future) -> None:
+        # Stops tracking a command cancelled or timed out locally so a late response is ignored
+        with self._lock:
+            if controller.pending.get(ticket) is future:
+                controller.pending.discard(ticket)
+
+    def _wake(self) -> None:
+        try:
+            self._wake_writer.send(b"\0")
+        except BlockingIOError:
+            pass  # A wake-up is already queued
+
+    def _io_worker(self) -> None:
+        while self._running:
+            self._run_io_calls()
+            for key, events in self._selector.select():
+                if key.fileobj is self._wake_reader:
+                    self._drain_wake()
+                    continue
+
+                controller, handler = key.data
+                if controller.connected:
+                    handler(controller, events)
+
+            self._flush_outboxes()
+
+    def _run_io_calls(self) -> None:
+        with self._lock:
+            calls = self._io_calls
+            self._io_calls = []
+        for call in calls:
+            call()
+
+    def _register(self, controller: Controller) -> None:
+        if controller.connected:
+            self._selector.register(controller.commander_socket, selectors.EVENT_READ, (controller, self._on_commander))
+            self._selector.register(controller.updater_socket, selectors.EVENT_READ, (controller, self._on_updater))
+
+    def _drain_wake(self) -> None:
+        try:
+            while self._wake_reader.recv(BUFFER_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _flush_outboxes(self) -> None:
+        with self._lock:
+            controllers = [controller for controller in self._controllers.values() if controller.outbox]
+        for controller in controllers:
+            self._write(controller)
+
+    def _write(self, controller: Controller) -> None:
+        with self._lock:
+            try:
+                sent = controller.commander_socket.send(controller.outbox)
+            except BlockingIOError:
+                sent = 0
+            except OSError as exception:
+                sent = -1
+                failure = exception
+            else:
+                del controller.outbox[:sent]
+            waiting = bool(controller.outbox)
+
+        if sent < 0:
+            self._disconnect(controller, ConnectionError(str(failure)))
+            return
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if waiting else 0)
+        self._selector.modify(controller.commander_socket, events, (controller, self._on_commander))
+
+    def _on_commander(self, controller: Controller, events: int) -> None:
+        if events & selectors.EVENT_WRITE:
+            self._write(controller)
+        if not events & selectors.EVENT_READ:
+            return
+
+        received = self._receive(controller, controller.commander_socket)
+        if received is None:
+            return
+
+        for message in controller.commander_decoder.feed(received):
+            response = decode_response(message)
+            with self._lock:
+                future = controller.pending.resolve(response)
+            if future is not None:
+                settle(future, response)  # The caller may have cancelled it
+
+    def _on_updater(self, controller: Controller, events: int) -> None:
+        received = self._receive(controller, controller.updater_socket)
+        if received is None:
+            return
+
+        for message in controller.updater_decoder.feed(received):
+            try:
+                update = decode_frame(message)
+            except ValueError:
+                continue
+            if not isinstance(update, dict):
+                continue  # Valid, but not an update
+
+            member = self._members.get(controller.name)
+            if member is not None:
+                member._note_update(update)
+            self.update_queue.put((controller.name, update), wait=False)
+
+        if self.update_queue.overflow == BLOCK and self.update_queue.full():
+            self._pause_updates(controller)
+
+    def _pause_updates(self, controller: Controller) -> None:
+        self._selector.unregister(controller.updater_socket)
+        with self._lock:
+            self._paused.append(controller)
+        if self._has_room():
+            self._resume_updates()  # Drained while pausing, so the dispatcher may already have looked
+
+    def _resume_updates(self) -> None:
+        with self._lock:
+            paused = self._paused
+            self._paused = []
+            self._resume_requested = False
+        for controller in paused:
+            if controller.connected:
+                self._selector.register(controller.updater_socket, selectors.EVENT_READ,
+                                        (controller, self._on_updater))
+
+    def _has_room(self) -> bool:
+        return len(self.update_queue) <= self.update_queue.maxsize // 2
+
+    def _dispatch_worker(self) -> None:
+        while (item := self.update_queue.get()) is not None or not self.update_queue.closed:
+            if item is None:
+                continue
+
+            with self._lock:
+                resume = self._paused and not self._resume_requested and self._has_room()
+                if resume:
+                    self._resume_requested = True
+                    self._io_calls.append(self._resume_updates)
+            if resume:
+                self._wake()
+
+            name, update = item
+            member = self._members.get(name)
+            if member is not None:
+                call_receiver(member._deliver_update, update)
+            if self.update_receiver is not None:
+                call_receiver(self.update_receiver, name, update)
+
+    def _receive(self, controller: Controller, connection: socket.socket) -> bytes:
+        try:
+            received = connection.recv(BUFFER_SIZE)
+        except BlockingIOError:
+            return None
+        except OSError:
+            received = b""
+
+        if not received:
+            self._disconnect(controller, ConnectionError(f"Controller '{controller.name}' closed the connection"))
+            return None
+
+        return received
+
+    def _disconnect(self, controller: Controller, exception: Exception) -> None:
+        if not controller.connected:
+            return
+
+        for connection in [controller.commander_socket, controller.updater_socket]:
+            try:
+                self._selector.unregister(connection)
+            except (KeyError, ValueError):
+                pass
+        controller.close()
+        self._fail_pending(controller, exception)
+
+    def _fail_pending(self, controller: Controller, exception: Exception) -> None:
+        with self._lock:
+            futures = controller.pending.clear()
+            controller.outbox.clear()
+        for future in futures:
+            try:
+                future.set_exception(exception)
+            except InvalidStateError:
+                pass  # Cancelled or timed out meanwhile
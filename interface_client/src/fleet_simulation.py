@@ -0,0 +1,201 @@
+# fleet_simulation.py
+# Thousands of simulated bridges for load testing, kept as one array per property and moved together each frame
+# Each bridge answers through the same API as a single SimulatedInterface, e.g. fleet["bridge_12"].execute("ping")
+
+import threading
+from math import floor
+from typing import Any, Callable, Iterable, Iterator
+
+from fleet import FleetUpdateReceiver
+from remote_interface import RemoteInterfaceHeader, UpdateReceiver
+from simulation import SimulatedCommands, Clock, SIMULATION_TICK_TIME
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_SPEED = 0.2  # As SimulatedInterface
+GO, STOP = 0, 1  # Codes of the light conditions the simulation sets itself
+MAX_CATCH_UP_FRAMES = 10  # Frames run at once to catch up with the clock before skipping ahead instead
+
+
+def run_paced(clock: Clock, tick: float, step: Callable[[int], Any], running: Callable[[], bool]) -> None:
+    # Calls step with the number of frames of tick seconds due on the clock, until running() is False
+    next_frame = clock.now()
+    while running():
+        behind = floor((clock.now() - next_frame) / tick) + 1  # Frames now due
+        if behind > MAX_CATCH_UP_FRAMES:
+            # Stalled for too long; the frames missed are dropped rather than run in one burst
+            next_frame += (behind - MAX_CATCH_UP_FRAMES) * tick
+            behind = MAX_CATCH_UP_FRAMES
+        if behind > 0:
+            step(behind)
+            next_frame += behind * tick
+        clock.sleep(next_frame - clock.now())
+
+
+class SimulatedFleet:
+    def __init__(self, bridges: int | Iterable[str], update_receiver: FleetUpdateReceiver = None,
+                 clock: Clock = None, seed: int = None, tick: float = SIMULATION_TICK_TIME, start: bool = True):
+        if numpy is None:
+            raise ImportError("SimulatedFleet needs NumPy")
+
+        self.names = [f"bridge_{index}" for index in range(bridges)] if isinstance(bridges, int) else list(bridges)
+        self.indices = {name: index for index, name in enumerate(self.names)}
+        self.update_receiver = update_receiver  # Called with the bridge's name and each update of every bridge
+        self.clock = clock or Clock()
+        self.random = numpy.random.default_rng(seed)
+        self.tick = tick
+        self.frames = 0
+
+        count = len(self.names)
+        self.positions = numpy.zeros(count)
+        self.targets = numpy.zeros(count)
+        self.speeds = numpy.full(count, DEFAULT_SPEED)
+        self.overrides = numpy.zeros(count, dtype=bool)
+        self.light_codes = numpy.full(count, GO, dtype=numpy.int16)
+        self.light_names = ["GO", "STOP"]  # Light conditions by code; others are added as commands set them
+
+        # Interfaces are only made for the bridges asked for, so a large fleet costs little more than its arrays
+        self._bridges: dict[int, SimulatedBridge] = {}
+        self._lock = threading.RLock()  # Held by frames and commands alike; reentrant for receivers that command
+
+        self._simulating = start
+        if start:
+            simulation = threading.Thread(target=self._simulate, daemon=True)
+            simulation.start()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, name: str) -> "SimulatedBridge":
+        return self.bridge(self.indices[name])
+
+    @property
+    def time(self) -> float:
+        return self.frames * self.tick
+
+    def bridge(self, index: int) -> "SimulatedBridge":
+        bridge = self._bridges.get(index)
+        if bridge is None:
+            bridge = self._bridges[index] = SimulatedBridge(self, index)
+        return bridge
+
+    def light_code(self, light_condition: str) -> int:
+        try:
+            return self.light_names.index(light_condition)
+        except ValueError:
+            self.light_names.append(light_condition)
+            return len(self.light_names) - 1
+
+    def step(self, frames: int = 1) -> None:
+        with self._lock:
+            for _ in range(frames):
+                self._simulate_frame(self.tick)
+                self.frames += 1
+
+    def run_for(self, seconds: float) -> None:
+        self.step(round(seconds / self.tick))
+
+    def quit(self) -> None:
+        self._simulating = False
+
+    def _simulate(self) -> None:
+        run_paced(self.clock, self.tick, self.step, lambda: self._simulating)
+
+    def _simulate_frame(self, delta: float) -> None:
+        # SimulatedInterface._simulate_bridge_movement for every bridge at once
+        automatic = ~self.overrides
+        self.light_codes[automatic] = numpy.where(self.positions[automatic] == 0.0, GO, STOP)
+
+        # move_towards, whole arrays at a time
+        difference = self.targets - self.positions
+        amount = self.speeds * delta
+        moved = numpy.where(numpy.abs(difference) <= amount, self.targets,
+                            self.positions + amount * numpy.sign(difference))
+        arrived = numpy.flatnonzero((moved != self.positions) & (moved == self.targets))
+        self.positions = moved
+
+        for index in arrived.tolist():
+            self._emit(index, {"event": "Bridge reached target position"})
+
+    def _emit(self, index: int, update: dict) -> None:
+        bridge = self._bridges.get(index)
+        if bridge is not None:
+            bridge._send_update(update)
+        elif self.update_receiver is not None:
+            self.update_receiver(self.names[index], update)
+
+
+class SimulatedBridge(SimulatedCommands, RemoteInterfaceHeader):  # One bridge of a SimulatedFleet, usable wherever an interface is expected
+    def __init__(self, fleet: SimulatedFleet, index: int, update_receiver: UpdateReceiver = None):
+        super().__init__(update_receiver)
+        self.fleet = fleet
+        self.index = index
+        self.name = fleet.names[index]
+        self._receiving_updates = True
+
+    # The state SimulatedInterface keeps in attributes, kept in the fleet's arrays instead
+
+    @property
+    def bridge_position(self) -> float:
+        return float(self.fleet.positions[self.index])
+
+    @bridge_position.setter
+    def bridge_position(self, value: float) -> None:
+        self.fleet.positions[self.index] = value
+
+    @property
+    def bridge_target_position(self) -> float:
+        return float(self.fleet.targets[self.index])
+
+    @bridge_target_position.setter
+    def bridge_target_position(self, value: float) -> None:
+        self.fleet.targets[self.index] = value
+
+    @property
+    def bridge_speed(self) -> float:
+        return float(self.fleet.speeds[self.index])
+
+    @bridge_speed.setter
+    def bridge_speed(self, value: float) -> None:
+        self.fleet.speeds[self.index] = value
+
+    @property
+    def light_condition(self) -> str:
+        return self.fleet.light_names[self.fleet.light_codes[self.index]]
+
+    @light_condition.setter
+    def light_condition(self, value: str) -> None:
+        self.fleet.light_codes[self.index] = self.fleet.light_code(value)
+
+    @property
+    def overrides_enabled(self) -> bool:
+        return bool(self.fleet.overrides[self.index])
+
+    @overrides_enabled.setter
+    def overrides_enabled(self, value: bool) -> None:
+        self.fleet.overrides[self.index] = value
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        # Answered exactly as a lone simulation would, through the properties above
+        with self.fleet._lock:
+            return self._apply_command(command_name, kwargs)
+
+    def _emit(self, information: dict) -> None:
+        self._send_update(information)
+
+    def _send_update(self, information: dict) -> bool:
+        delivered = super()._send_update(information)
+        if self.fleet.update_receiver is not None:
+            self.fleet.update_receiver(self.name, information)
+            delivered = True
+        return delivered
+
+    def quit(self) -> None:
+        # Only lets go of this interface; the bridge itself carries on with the rest of the fleet
+        self.fleet._bridges.pop(self.index, None)
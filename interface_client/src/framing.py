@@ -0,0 +1,144 @@
+# framing.py
+# Splits a TCP byte stream back into the messages the server wrote
+# Text messages end with the delimiter; binary messages start with a marker and a big-endian 16 bit length
+# Text messages keep any surrounding whitespace, such as the carriage return of println, which JSON ignores anyway
+
+from typing import Iterator
+
+MESSAGE_DELIMITER = b"\n"
+BINARY_FRAME_MARKER = 0xC1  # Never used by MessagePack, and never the start of a JSON document
+BINARY_HEADER_SIZE = 3  # Marker and length
+_BINARY_FRAME_MARKER_BYTE = bytes((BINARY_FRAME_MARKER,))
+MAX_MESSAGE_SIZE = 65536  # Far above the server's JSON capacity; only a corrupt stream gets this long
+READ_SIZE = 4096  # Free space ensured before each read
+INITIAL_CAPACITY = 4 * READ_SIZE
+
+
+class StreamDecoder:
+    # Messages are located in one reusable buffer, which sockets can read straight into with receive
+    def __init__(self, delimiter: bytes = MESSAGE_DELIMITER, max_message_size: int = MAX_MESSAGE_SIZE,
+                 capacity: int = INITIAL_CAPACITY):
+        self.delimiter = delimiter
+        self.max_message_size = max_message_size
+        self.discarded_bytes = 0
+
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # First byte not yet returned in a message
+        self._end = 0  # End of the bytes received
+        self._scanned = 0  # Bytes already searched for a delimiter, so partial messages are not rescanned
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def feed(self, data: bytes) -> list[bytes]:
+        # Returns every message completed by the given data; any trailing partial message is kept for the next feed
+        # Binary messages are returned whole, marker included, so they can be told apart from text
+        self._reserve(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self._end += len(data)
+        return [bytes(message) for message in self.messages()]
+
+    def receive(self, connection, size: int = READ_SIZE) -> int:
+        # Reads from a socket into the buffer without an intermediate copy; returns 0 once the connection has closed
+        self._reserve(size)
+        received = connection.recv_into(self._view[self._end:self._end + size])
+        self._end += received
+        return received
+
+    def messages(self) -> Iterator[memoryview]:
+        # The messages completed by what was received, as views into the buffer, made one at a time
+        # The views are only valid until the next receive or feed, so they must be decoded or copied before then
+        # The marker can never appear in UTF-8 text, so streams without it take the quicker text-only path
+        if self._buffer.find(_BINARY_FRAME_MARKER_BYTE, self._start, self._end) < 0:
+            yield from self._split_text()
+        else:
+            yield from self._split_mixed()
+
+        if self._start == self._end:
+            self._start = self._end = self._scanned = 0  # Nothing left over, so the next read starts at the front
+        elif self._end - self._start > self.max_message_size:
+            self.discarded_bytes += self._end - self._start
+            self.reset()
+
+    def reset(self) -> None:
+        self._start = self._end = self._scanned = 0
+
+    def _reserve(self, size: int) -> None:
+        free = len(self._buffer) - self._end
+        if free >= size:
+            return
+
+        pending = self._end - self._start
+        if len(self._buffer) - pending >= size:
+            # Moving the partial message to the front frees enough; memoryview assignment copes with the overlap
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # A new buffer rather than a resize, as views of the old one may still be held
+            capacity = len(self._buffer)
+            while capacity - pending < size:
+                capacity *= 2
+            buffer = bytearray(capacity)
+            view = memoryview(buffer)
+            view[:pending] = self._view[self._start:self._end]
+            self._buffer, self._view = buffer, view
+
+        self._scanned -= self._start
+        self._start, self._end = 0, pending
+
+    # Both splits mark each message consumed before handing it out, so a caller may stop iterating at any point
+
+    def _split_text(self) -> Iterator[memoryview]:
+        buffer = self._buffer
+        view = self._view
+        delimiter = self.delimiter
+        delimiter_length = len(delimiter)
+        end_of_data = self._end
+
+        start = self._start
+        end = buffer.find(delimiter, max(start, self._scanned), end_of_data)
+        while end >= 0:
+            next_start = end + delimiter_length
+            if end - start > 2 or buffer[start:end].strip():
+                self._start = next_start
+                yield view[start:end]
+            start = next_start
+            end = buffer.find(delimiter, start, end_of_data)
+
+        self._start = start
+        self._scanned = max(start, end_of_data - delimiter_length + 1)
+
+    def _split_mixed(self) -> Iterator[memoryview]:
+        buffer = self._buffer
+        view = self._view
+        delimiter_length = len(self.delimiter)
+        end_of_data = self._end
+
+        start = self._start
+        search_from = max(start, self._scanned)
+        while start < end_of_data:
+            if buffer[start] == BINARY_FRAME_MARKER:
+                if end_of_data - start < BINARY_HEADER_SIZE:
+                    break
+                end = start + BINARY_HEADER_SIZE + (buffer[start + 1] << 8 | buffer[start + 2])
+                if end > end_of_data:
+                    break
+
+                self._start = end
+                yield view[start:end]
+                start = search_from = end
+                continue
+
+            end = buffer.find(self.delimiter, max(start, search_from), end_of_data)
+            if end < 0:
+                search_from = max(start, end_of_data - delimiter_length + 1)
+                break
+
+            next_start = end + delimiter_length
+            if end - start > 2 or buffer[start:end].strip():
+                self._start = next_start
+                yield view[start:end]
+            start = search_from = next_start
+
+        self._start = start
+        self._scanned = max(start, search_from)
@@ -5,6 +5,7 @@ from common import *
 
 from monitor import TableMonitor, VisualMonitor, HistoryMonitor
 from control_panel import ControlPanel
+from update_router import UpdateRouter
 
 class Host(Tk):
     def __init__(self):
@@ -23,6 +24,9 @@ class Host(Tk):
         self.control_panel = ControlPanel(self)
 
         self.monitors = [self.table_monitor, self.visual_monitor, self.history_monitor]
+        self.update_router = UpdateRouter()
+        for monitor in self.monitors:
+            self.update_router.subscribe(monitor.update_information, monitor.update_keys, monitor.update_prefixes)
 
         column_sizes = [1, 5, 1]
         for column_index in range(len(column_sizes)):
@@ -43,8 +47,8 @@ class Host(Tk):
             panel.grid(sticky="nsew", **info)
 
     def update_information(self, information: dict):
-        for monitor in self.monitors:
-            monitor.update_information(information)
+        # Each monitor is handed only the keys it shows
+        self.update_router.dispatch(information)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,275 @@
+# impairment.py
+# Wi-Fi-like conditions for links that have none: latency, jitter, loss, reordering, limited bandwidth and the
+# firmware's commander poll delay, either around any interface or as a TCP proxy in front of a stand-in server
+# Run: python impairment.py --target-commander-port 56555 --target-updater-port 56055 --latency 0.02 --loss 0.01
+# to impair the way to a server.py started with those ports
+
+import asyncio
+import threading
+from argparse import ArgumentParser
+from heapq import heappush, heappop
+from math import ceil
+from random import Random
+from time import perf_counter as check_timer
+from time import sleep as wait
+
+from capture import reframe
+from framing import StreamDecoder
+from remote_interface import RemoteInterfaceHeader, BUFFER_SIZE, COMMANDER_PORT, UPDATER_PORT, DEFAULT_TIMEOUT
+from remote_interface import encode_command, error_response
+from wire_codec import json_codec
+
+FIRMWARE_POLL_DELAY = 0.05  # The firmware only looks for commands this often
+REORDER_DELAY = 0.01  # Added to a reordered message's delay beyond the latency and jitter it already has
+UPLINK = "up"  # Client to controller
+DOWNLINK = "down"
+
+# Roughly a busy ESP32 soft access point, e.g. Impairment(**SOFT_AP_CONDITIONS, seed=1)
+SOFT_AP_CONDITIONS = {"latency": 0.004, "jitter": 0.006, "loss": 0.005, "reorder": 0.0, "bandwidth": 125_000,
+                      "poll_delay": FIRMWARE_POLL_DELAY}
+
+
+class Impairment:
+    # Decides when, if ever, each message arrives. One instance stands for one link, shared by all its connections
+    # Messages keep their order within a direction unless picked for reordering; jitter alone never reorders
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, reorder: float = 0.0,
+                 bandwidth: float = None, poll_delay: float = 0.0, retransmit_timeout: float = None,
+                 seed: int = None):
+        self.latency = latency  # Seconds each way
+        self.jitter = jitter  # Most seconds the latency varies by either way
+        self.loss = loss  # Chance a message is lost
+        self.reorder = reorder  # Chance a message is held back behind later ones
+        self.bandwidth = bandwidth  # Bytes per second each way, or None for no limit
+        self.poll_delay = poll_delay  # Seconds between the firmware's looks for commands
+        self.retransmit_timeout = retransmit_timeout  # Lost messages arrive this much later if set, as over TCP
+        self.random = Random(seed)
+        self._poll_phase = self.random.uniform(0.0, poll_delay)
+
+        self.lost = 0
+        self.reordered = 0
+
+        self._lock = threading.Lock()
+        self._busy_until = {UPLINK: 0.0, DOWNLINK: 0.0}  # When each direction is next free to send
+        self._last_arrival = {UPLINK: 0.0, DOWNLINK: 0.0}
+
+    def schedule(self, size: int, direction: str, now: float) -> float:
+        # When a message of size bytes sent at now arrives, on the same timer as now; None if it never does
+        with self._lock:
+            random = self.random
+            sent = now
+            if self.bandwidth:
+                sent = self._busy_until[direction] = max(now, self._busy_until[direction]) + size / self.bandwidth
+
+            arrival = sent + max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+            if self.loss and random.random() < self.loss:
+                self.lost += 1
+                if self.retransmit_timeout is None:
+                    return None
+                arrival += self.retransmit_timeout
+
+            if self.reorder and random.random() < self.reorder:
+                self.reordered += 1
+                return arrival + self.latency + REORDER_DELAY  # Later messages may overtake it
+
+            arrival = self._last_arrival[direction] = max(arrival, self._last_arrival[direction])
+            return arrival
+
+    def picked_up(self, arrival: float) -> float:
+        # When a command arriving at the controller is first looked at; commands keep their order
+        if not self.poll_delay:
+            return arrival
+        return self._poll_phase + ceil((arrival - self._poll_phase) / self.poll_delay) * self.poll_delay
+
+
+class ImpairedInterface(RemoteInterfaceHeader):  # Any interface, seen through an impaired link
+    def __init__(self, interface: RemoteInterfaceHeader, impairment: Impairment, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__()
+        self.interface = interface
+        self.impairment = impairment
+        self.timeout = timeout  # Commands answered later than this, or lost, answer TIMEOUT as RemoteInterface would
+        self._receiving_updates = True
+
+        # Updates as a heap of (arrival, sequence, update), delivered from a thread of their own
+        self._arrivals: list[tuple[float, int, dict]] = []
+        self._arrival_sequence = 0
+        self._arrival_condition = threading.Condition()
+        self._closing = False
+        self._subscription = interface.subscribe(self._update_sent)
+
+        self.delivery_thread = threading.Thread(target=self._delivery_worker, daemon=True)
+        self.delivery_thread.start()
+
+    def quit(self) -> None:
+        self.interface.unsubscribe(self._subscription)
+        with self._arrival_condition:
+            self._closing = True
+            self._arrival_condition.notify()
+        self.interface.quit()
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        impairment = self.impairment
+        sent = check_timer()
+        deadline = sent + self.timeout if self.timeout is not None else None
+
+        arrival = impairment.schedule(len(encode_command(command_name, kwargs)), UPLINK, sent)
+        if arrival is not None:
+            arrival = impairment.picked_up(arrival)
+        if arrival is None or (deadline is not None and arrival > deadline):
+            return self._time_out(deadline)
+
+        wait(max(0.0, arrival - check_timer()))
+        response = self.interface.execute(command_name, **kwargs)
+
+        answered = impairment.schedule(len(json_codec.encode(response)), DOWNLINK, check_timer())
+        if answered is None or (deadline is not None and answered > deadline):
+            return self._time_out(deadline)
+
+        wait(max(0.0, answered - check_timer()))
+        return response
+
+    @staticmethod
+    def _time_out(deadline: float) -> dict:
+        if deadline is None:
+            raise ConnectionError("Command lost with no timeout to end the wait")
+        wait(max(0.0, deadline - check_timer()))
+        return error_response("TIMEOUT")
+
+    def _update_sent(self, update: dict) -> None:
+        arrival = self.impairment.schedule(len(json_codec.encode(update)), DOWNLINK, check_timer())
+        if arrival is None:
+            return
+
+        with self._arrival_condition:
+            self._arrival_sequence += 1
+            heappush(self._arrivals, (arrival, self._arrival_sequence, update))
+            self._arrival_condition.notify()
+
+    def _delivery_worker(self) -> None:
+        while True:
+            with self._arrival_condition:
+                while not self._closing and (not self._arrivals or self._arrivals[0][0] > check_timer()):
+                    self._arrival_condition.wait(self._arrivals[0][0] - check_timer() if self._arrivals else None)
+                if self._closing:
+                    return
+                _, _, update = heappop(self._arrivals)
+
+            self._send_update(update)
+
+
+class ImpairmentProxy:
+    # Listens where a client expects the controller and forwards whole messages to a server elsewhere, each
+    # arriving when the impairment decides
+    def __init__(self, impairment: Impairment, target_host: str = "127.0.0.1",
+                 target_commander_port: int = COMMANDER_PORT, target_updater_port: int = UPDATER_PORT,
+                 host: str = "127.0.0.1", commander_port: int = COMMANDER_PORT, updater_port: int = UPDATER_PORT):
+        self.impairment = impairment
+        self.target_host = target_host
+        self.target_ports = {commander_port: target_commander_port, updater_port: target_updater_port}
+        self.host = host
+        self.commander_port = commander_port
+        self.updater_port = updater_port
+
+        self._servers: list[asyncio.AbstractServer] = []
+        self._connection_tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._servers = [
+            await asyncio.start_server(lambda reader, writer, port=port: self._forward(reader, writer, port),
+                                       self.host, port)
+            for port in [self.commander_port, self.updater_port]
+        ]
+
+    async def serve_forever(self) -> None:
+        if not self._servers:
+            await self.start()
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+        for task in list(self._connection_tasks):
+            task.cancel()
+        await asyncio.gather(*self._connection_tasks, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    async def _forward(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int) -> None:
+        self._connection_tasks.add(asyncio.current_task())
+        try:
+            target_reader, target_writer = await asyncio.open_connection(self.target_host, self.target_ports[port])
+        except OSError:
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+            return
+
+        polled = port == self.commander_port
+        try:
+            await asyncio.gather(self._pump(reader, target_writer, UPLINK, polled),
+                                 self._pump(target_reader, writer, DOWNLINK, False))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+            target_writer.close()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, direction: str,
+                    polled: bool) -> None:
+        loop = asyncio.get_running_loop()
+        decoder = StreamDecoder()
+        last_arrival = loop.time()
+        while received := await reader.read(BUFFER_SIZE):
+            for message in decoder.feed(received):
+                frame = reframe(message)
+                arrival = self.impairment.schedule(len(frame), direction, loop.time())
+                if arrival is None:
+                    continue
+                if polled:
+                    arrival = self.impairment.picked_up(arrival)
+
+                # Timer handles due at the same time run in the order they were made, so order is kept
+                loop.call_at(arrival, writer.write, frame)
+                last_arrival = max(last_arrival, arrival)
+
+        # Ends the other side only once everything already sent has arrived
+        await asyncio.sleep(max(0.0, last_arrival - loop.time()))
+        if writer.can_write_eof():
+            writer.write_eof()
+
+
+async def main(arguments) -> None:
+    impairment = Impairment(arguments.latency, arguments.jitter, arguments.loss, arguments.reorder,
+                            arguments.bandwidth, arguments.poll_delay, arguments.retransmit_timeout, arguments.seed)
+    proxy = ImpairmentProxy(impairment, arguments.target_host, arguments.target_commander_port,
+                            arguments.target_updater_port, arguments.host)
+    await proxy.start()
+    print(f"Impairing {arguments.host} -> {arguments.target_host}, ports {arguments.target_commander_port} "
+          f"and {arguments.target_updater_port}")
+    try:
+        await proxy.serve_forever()
+    finally:
+        await proxy.close()
+        print(f"{impairment.lost} messages lost, {impairment.reordered} reordered")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Impairing proxy in front of a controller or stand-in server")
+    parser.add_argument("--host", default="127.0.0.1", help="Where clients connect, on the usual ports")
+    parser.add_argument("--target-host", default="127.0.0.1")
+    parser.add_argument("--target-commander-port", type=int, default=COMMANDER_PORT)
+    parser.add_argument("--target-updater-port", type=int, default=UPDATER_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each way")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0, help="Chance a message is lost")
+    parser.add_argument("--reorder", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, help="Bytes per second each way")
+    parser.add_argument("--poll-delay", type=float, default=FIRMWARE_POLL_DELAY)
+    parser.add_argument("--retransmit-timeout", type=float, help="Delay lost messages by this instead of dropping them")
+    parser.add_argument("--seed", type=int)
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(main(arguments))
+    except KeyboardInterrupt:
+        pass
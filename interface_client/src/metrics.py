@@ -0,0 +1,182 @@
+# metrics.py
+# Cheap always-on instrumentation: command latency histograms, response outcomes, traffic and update rates
+
+import threading
+from collections import Counter, deque
+from math import frexp, ldexp
+from time import perf_counter as check_timer
+
+SUB_BUCKETS = 8  # Histogram buckets per doubling, bounding the relative error of a percentile to about 6%
+RATE_WINDOW = 10  # Seconds of history kept for arrival rates
+
+
+class LatencyHistogram:
+    # Log-linear buckets over microseconds; recording is O(1) and the memory used grows only with the range seen
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._buckets: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        microseconds = seconds * 1e6
+        if microseconds < 1.0:
+            index = 0
+        else:
+            mantissa, exponent = frexp(microseconds)
+            index = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        # Upper bound of the bucket holding the given fraction of samples, in seconds
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, round(fraction * self.count))
+            seen = 0
+            for index in sorted(self._buckets):
+                seen += self._buckets[index]
+                if seen >= rank:
+                    return min(self.maximum, self._upper_bound(index))
+            return self.maximum
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.maximum,
+        }
+
+    @staticmethod
+    def _upper_bound(index: int) -> float:
+        if index == 0:
+            return 1e-6
+        exponent, sub_bucket = divmod(index, SUB_BUCKETS)
+        return ldexp(0.5 + (sub_bucket + 1) / (2 * SUB_BUCKETS), exponent) / 1e6
+
+
+class RateMeter:
+    # Arrivals counted per whole second over a sliding window
+    def __init__(self, window: int = RATE_WINDOW):
+        self.window = window
+        self.total = 0
+        self._seconds: deque[list[int]] = deque()  # [second, count]
+        self._lock = threading.Lock()
+
+    def mark(self, amount: int = 1) -> None:
+        second = int(check_timer())
+        with self._lock:
+            self.total += amount
+            if self._seconds and self._seconds[-1][0] == second:
+                self._seconds[-1][1] += amount
+            else:
+                self._seconds.append([second, amount])
+                while self._seconds[0][0] <= second - self.window:
+                    self._seconds.popleft()
+
+    def rate(self) -> float:
+        # Arrivals per second over the completed seconds of the window
+        now = int(check_timer())
+        with self._lock:
+            counted = sum(count for second, count in self._seconds if now - self.window <= second < now)
+        return counted / self.window
+
+
+class InterfaceMetrics:
+    def __init__(self, error_names: dict[int, str] = None):
+        self.error_names = error_names or {}  # Error codes to the names outcomes are counted under
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.updates = RateMeter()
+
+        self._latency: dict[str, LatencyHistogram] = {}
+        self._outcomes: dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def record_command(self, command_name: str, seconds: float, response: dict) -> None:
+        self.latency(command_name).record(seconds)
+        self.record_outcome(command_name, self.outcome_of(response))
+
+    def outcome_of(self, response: dict) -> str:
+        response_type = response.get("response", "VOID")
+        if response_type == "ERR":
+            code = response.get("error_code")
+            return "ERR:" + self.error_names.get(code, str(code))
+        return response_type
+
+    def count_sent(self, amount: int) -> None:
+        with self._lock:
+            self.bytes_sent += amount
+
+    def count_received(self, amount: int) -> None:
+        with self._lock:
+            self.bytes_received += amount
+
+    def record_outcome(self, command_name: str, outcome: str) -> None:
+        with self._lock:
+            outcomes = self._outcomes.get(command_name)
+            if outcomes is None:
+                outcomes = self._outcomes[command_name] = Counter()
+            outcomes[outcome] += 1
+
+    def latency(self, command_name: str) -> LatencyHistogram:
+        histogram = self._latency.get(command_name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latency.setdefault(command_name, LatencyHistogram())
+        return histogram
+
+    def outcomes(self, command_name: str = None) -> Counter:
+        # Outcomes of one command, or of every command together
+        with self._lock:
+            if command_name is not None:
+                return Counter(self._outcomes.get(command_name, {}))
+            return sum(self._outcomes.values(), Counter())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            commands = sorted(set(self._latency) | set(self._outcomes))
+        return {
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "updates_received": self.updates.total,
+            "update_rate": self.updates.rate(),
+            "commands": {
+                command_name: {
+                    "latency": self.latency(command_name).summary(),
+                    "outcomes": dict(self.outcomes(command_name)),
+                }
+                for command_name in commands
+            },
+        }
+
+    def summary(self) -> dict[str, str]:
+        # One readable line per figure, for printing
+        snapshot = self.snapshot()
+        lines = {
+            "bytes_sent": str(snapshot["bytes_sent"]),
+            "bytes_received": str(snapshot["bytes_received"]),
+            "updates_received": str(snapshot["updates_received"]),
+            "update_rate": f"{snapshot['update_rate']:.1f}/s",
+        }
+        for command_name, figures in snapshot["commands"].items():
+            latency = figures["latency"]
+            lines[f"{command_name} latency"] = (
+                f"n={latency['count']} p50={latency['p50'] * 1e3:.2f}ms p95={latency['p95'] * 1e3:.2f}ms "
+                f"p99={latency['p99'] * 1e3:.2f}ms max={latency['max'] * 1e3:.2f}ms"
+            )
+            lines[f"{command_name} outcomes"] = " ".join(
+                f"{outcome}={count}" for outcome, count in sorted(figures["outcomes"].items())
+            )
+        return lines
+
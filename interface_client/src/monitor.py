@@ -6,6 +6,10 @@ from bridge_display import BridgeDisplay  # A canvas override
 
 
 class Monitor(Frame):
+    # The update keys, and key prefixes, the monitor is shown; neither means every update
+    update_keys: tuple[str, ...] = ()
+    update_prefixes: tuple[str, ...] = ()
+
     def __init__(self, master: Misc, initial_information: dict = None):
         super().__init__(master)
         if initial_information is None:
@@ -52,6 +56,8 @@ class TableMonitor(Monitor):  # Displays information in a key-value table
 
 
 class VisualMonitor(Monitor):  # Displays information in a graphic
+    update_keys = ("current_position",)
+
     def __init__(self, master: Misc, initial_information: dict = None):
         super().__init__(master, initial_information)
         self.title = Title(self, "Visualizer")
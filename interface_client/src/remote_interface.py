@@ -1,15 +1,44 @@
 # remote_interface.py
 import socket
-import json
 import threading
-from json import JSONDecodeError
-from typing import Callable, Any
+import traceback
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from heapq import heappush, heappop
+from time import perf_counter as check_timer
+from typing import Callable, Any, Iterable
+
+from capture import CaptureWriter, COMMAND, RESPONSE, UPDATE, UPDATER_COMMAND, unframe
+from commands import CommandRegistry, BoundCommands, command_registry, USE_TEMPLATES
+from framing import StreamDecoder
+from metrics import InterfaceMetrics
+from response_cache import ResponseCache
+from update_router import UpdateRouter, Subscription
+from wire_codec import WireCodec, json_codec, codecs, decode_frame, JSON_CODEC
+from update_queue import UpdateQueue, UPDATE_QUEUE_SIZE, BLOCK
 
 BUFFER_SIZE = 4096
 COMMANDER_PORT = 55555
 UPDATER_PORT = 55055
+MAX_TICKET = 65535  # Tickets are an unsigned short on the server; 0 means "no ticket"
+
+# Commands and updates on their own ports, or sharing the commander connection with updates wrapped as {"update": ...}
+SEPARATE_TRANSPORT = "separate"
+MULTIPLEXED_TRANSPORT = "multiplexed"
+MULTIPLEXED_UPDATE_KEY = "update"
+
+CONNECT_TIMEOUT = 1.0
+RECONNECT_INITIAL_DELAY = 0.05
+RECONNECT_MAX_DELAY = 0.5
+REPLAY_LIMIT = 64  # Commands held while disconnected
+PING_INTERVAL = 1.0
+PING_TOLERANCE = 3  # Ping intervals without any response before the link is presumed dead
+DEFAULT_TIMEOUT = 5.0  # Seconds execute waits for a response; None waits forever
+QUIT_TIMEOUT = 1.0
 
 UpdateReceiver: type = Callable[[dict], Any]
+ResponseCallback: type = Callable[[dict], Any]
+CommandBatch: type = Iterable[tuple[str, dict]]
 
 error_code = {
     "DEBUG": -2,
@@ -24,13 +53,158 @@ error_code = {
 }
 
 
+error_name = {code: name for name, code in error_code.items()}
+
+
+def error_response(error_type: str) -> dict:
+    return {"response": "ERR", "error_code": error_code[error_type]}
+
+
+def decode_response(message: bytes | memoryview) -> dict:
+    #Ensure response is valid dictionary JSON
+    try:
+        json_response = decode_frame(message)
+    except ValueError:
+        json_response = None
+
+    if not isinstance(json_response, dict):  # Unreadable, or valid but not an object, e.g. [1, 2] or null
+        return {
+            "response": "ERR",
+            "error_code": error_code["BAD_JSON"],
+            "source": bytes(message),  # Copied, as the message may be a view into a reused buffer
+        }
+
+    if "response" not in json_response.keys():
+        json_response["response"] = "VOID"
+    return json_response
+
+
+def deadline_after(timeout: float) -> float:
+    return None if timeout is None else check_timer() + timeout
+
+
+def settle(future: Future, response: dict) -> None:
+    try:
+        future.set_result(response)
+    except InvalidStateError:
+        pass  # Already cancelled or timed out
+
+
+def wait_for_response(future: Future, deadline: float) -> dict:
+    # The future's response, or a TIMEOUT error if none arrives by the deadline; None waits forever
+    timeout = None if deadline is None else max(0.0, deadline - check_timer())
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        settle(future, error_response("TIMEOUT"))
+        return future.result()  # The answer instead, if it arrived while timing out
+
+
+def call_receiver(receiver: Callable, *arguments) -> None:
+    # Receivers are called on threads that must outlive them, so one that raises misses this update, not the rest
+    try:
+        receiver(*arguments)
+    except Exception:
+        traceback.print_exc()
+
+
+def encode_command(command_name: str, kwargs: dict = None, ticket: int = 0, codec: WireCodec = json_codec,
+                   registry: CommandRegistry = command_registry) -> bytes:
+    if codec is json_codec and USE_TEMPLATES:
+        # Declared commands have their JSON pre-encoded up to the arguments
+        spec = registry.get(command_name)
+        if spec is not None:
+            return spec.encode(kwargs or {}, ticket)
+    return codec.encode({"command": command_name, "kwargs": {**(kwargs or {})}, "ticket": ticket})
+
+
+class PendingCommands:
+    # Commands in flight, keyed by the ticket the server echoes back in its response. Not thread-safe by itself
+    def __init__(self):
+        self._pending: dict[int, Any] = {}
+        self._last_ticket = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def register(self, waiter: Any) -> int:
+        # Skips tickets still awaiting a response after wrapping around
+        ticket = self._last_ticket
+        for _ in range(MAX_TICKET):
+            ticket = ticket % MAX_TICKET + 1
+            if ticket not in self._pending:
+                self._last_ticket = ticket
+                self._pending[ticket] = waiter
+                return ticket
+        raise RuntimeError("Too many commands in flight")
+
+    def get(self, ticket: int) -> Any:
+        return self._pending.get(ticket)
+
+    def discard(self, ticket: int) -> Any:
+        return self._pending.pop(ticket, None)
+
+    def resolve(self, response: dict) -> Any:
+        ticket = response.get("ticket", 0)
+        if ticket:
+            # A ticket nobody is waiting on belongs to a command that was cancelled or timed out
+            return self._pending.pop(ticket, None)
+
+        if self._pending:
+            # Unticketed or unreadable response; the server answers in order so it belongs to the oldest command
+            return self._pending.pop(next(iter(self._pending)))
+        return None
+
+    def encode_batch(self, commands: Iterable[tuple[Any, Callable[[int], bytes]]]) -> tuple[bytearray, list, list]:
+        # Registers each (waiter, encode) and encodes it under its ticket, returning the batch to write, each ticket,
+        # and the (waiter, exception) of any that could not be encoded; those are 0 in the tickets and not pending
+        batch = bytearray()
+        tickets = []
+        unencodable = []
+        for waiter, encode in commands:
+            ticket = self.register(waiter)
+            try:
+                batch += encode(ticket)
+            except Exception as exception:
+                del self._pending[ticket]
+                ticket = 0
+                unencodable.append((waiter, exception))
+            tickets.append(ticket)
+        return batch, tickets, unencodable
+
+    def clear(self) -> list:
+        waiters = list(self._pending.values())
+        self._pending.clear()
+        return waiters
+
+
 class RemoteInterfaceHeader:
+    _times_own_commands = False  # Set by interfaces that time commands where they dispatch them, pipelined ones included
+
     def __init__(self, update_receiver: UpdateReceiver = None):
         self.update_receiver = update_receiver
         self._receiving_updates = False
+        self.response_cache: ResponseCache = None  # Opt in with enable_cache
+        self.metrics = InterfaceMetrics(error_name)
+        self._update_observers: list[UpdateReceiver] = []
+        self.update_router = UpdateRouter()
+        self.use_command_registry(command_registry)
 
     def execute(self, command_name: str, **kwargs) -> dict:
-        raise NotImplementedError("Execution method not defined")
+        return self._execute_cached(command_name, kwargs, self._execute)
+
+    def enable_cache(self, **options) -> ResponseCache:
+        # Options are those of ResponseCache, e.g. ttls={"get_bridge_position": 0.1}
+        self.response_cache = ResponseCache(**options)
+        return self.response_cache
+
+    def execute_many(self, commands: CommandBatch) -> list[dict]:
+        return [self.execute(command_name, **(kwargs or {})) for command_name, kwargs in commands]
+
+    def use_command_registry(self, registry: CommandRegistry) -> None:
+        # The commands offered as stubs, e.g. self.commands.set_bridge_position(position=0.5)
+        self.command_registry = registry
+        self.commands = BoundCommands(self, registry)
 
     @property
     def receiving_updates(self) -> bool:
@@ -51,61 +225,246 @@ class RemoteInterfaceHeader:
     def quit(self) -> None:
         raise NotImplementedError("Quit method not defined")
 
+    def observe_updates(self, observer: UpdateReceiver) -> None:
+        # Observers see every update as it arrives, on the receiving thread, so they must be quick
+        self._update_observers = self._update_observers + [observer]
+
+    def stop_observing(self, observer: UpdateReceiver) -> None:
+        self._update_observers = [existing for existing in self._update_observers if existing != observer]
+
+    def subscribe(self, handler: UpdateReceiver, keys: Iterable[str] = None,
+                  prefixes: Iterable[str] = None) -> Subscription:
+        # Delivers only the named keys, or those starting with a prefix, alongside the update receiver
+        # e.g. subscribe(show_position, keys=["current_position"]); with neither, every update whole
+        return self.update_router.subscribe(handler, keys, prefixes)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.update_router.unsubscribe(subscription)
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        raise NotImplementedError("Execution method not defined")
+
+    def _execute_cached(self, command_name: str, kwargs: dict, fetch: Callable[[str, dict], dict]) -> dict:
+        cached, token = self._cache_lookup(command_name, kwargs)
+        if cached is not None:
+            return cached
+
+        started = check_timer()
+        response = fetch(command_name, kwargs)
+        if not self._times_own_commands:
+            self.metrics.record_command(command_name, check_timer() - started, response)
+        self._cache_store(token, response)
+        return response
+
+    def _reject(self, command_name: str, problem: str) -> dict:
+        # Answers a command stub called with arguments the server would refuse, without sending anything
+        self.metrics.record_outcome(command_name, "REJECTED")
+        return {**error_response("INVALID_ARGS"), "reason": problem}
+
+    def _cache_lookup(self, command_name: str, kwargs: dict) -> tuple[dict, Any]:
+        if self.response_cache is None:
+            return None, None
+
+        self.response_cache.command_sent(command_name)
+        return self.response_cache.lookup(command_name, kwargs)
+
+    def _cache_store(self, token: Any, response: dict) -> None:
+        if self.response_cache is not None:
+            self.response_cache.store(token, response)
+
+    def _record_result(self, command_name: str, submitted: float, future: Any) -> None:
+        # Done callback of a dispatched command's future; the latency is as long as the caller waited for an answer
+        if future.cancelled():
+            self.metrics.record_outcome(command_name, "CANCELLED")
+        elif future.exception() is not None:
+            self.metrics.record_outcome(command_name, "FAILED")
+        else:
+            self.metrics.record_command(command_name, check_timer() - submitted, future.result())
+
     def _send_update(self, information: dict) -> bool:
+        self._note_update(information)
+        return self._deliver_update(information)
+
+    def _note_update(self, information: dict) -> None:
+        # Bookkeeping done as soon as an update arrives, even if it is never delivered
+        self.metrics.updates.mark()
+        if self.response_cache is not None:
+            self.response_cache.update_received(information)
+        for observer in self._update_observers:
+            call_receiver(observer, information)
+
+    def _deliver_update(self, information: dict) -> bool:
+        delivered = self.update_router.dispatch(information) > 0
         if self.update_receiver is None:
-            return False
+            return delivered
 
         self.update_receiver(information)
 
         return True
 
 
+class CommandEntry:  # A command submitted to a RemoteInterface, kept until answered so it can be replayed
+    __slots__ = ("future", "command_name", "kwargs", "ticket", "submitted")
+
+    def __init__(self, command_name: str, kwargs: dict):
+        self.future = Future()
+        self.command_name = command_name
+        self.kwargs = kwargs
+        self.ticket = 0
+        self.submitted = check_timer()
+
+
 class RemoteInterface(RemoteInterfaceHeader):
-    def __init__(self, host: str = "192.168.4.1", update_receiver: UpdateReceiver = None):
+    _times_own_commands = True
+
+    def __init__(self, host: str = "192.168.4.1", update_receiver: UpdateReceiver = None, reconnect: bool = True,
+                 replay_limit: int = REPLAY_LIMIT, ping_interval: float = PING_INTERVAL,
+                 timeout: float = DEFAULT_TIMEOUT, update_queue_size: int = UPDATE_QUEUE_SIZE,
+                 overflow_policy: str = BLOCK, codec_preference: list[str] = None,
+                 capture: str | CaptureWriter = None, multiplex: bool = False):
         super().__init__(update_receiver)
+        self.host = host
+        self.reconnect = reconnect
+        self.replay_limit = replay_limit
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.rtt: float = None  # Round trip time of the last answered ping, in seconds
+
+        # Every connection starts out in JSON; the server may then agree to a preferred codec
+        # Binary only if asked for, e.g. codec_preference=[BINARY_CODEC, JSON_CODEC]; the firmware only speaks JSON,
+        # and asking it costs a round trip on each connection
+        self.codec_preference = [JSON_CODEC] if codec_preference is None else codec_preference
+        self.codec = json_codec
+        self._codec_lock = threading.Lock()
+
+        # Asked for on every connection when multiplex is set; servers that refuse, like the firmware, get two
+        self.multiplex = multiplex
+        self.multiplexed = False  # Whether the current connection carries the updates too
+
+        # Every command, response and update is logged here when given a path or writer
+        self._owns_capture = isinstance(capture, str)
+        self.capture: CaptureWriter = CaptureWriter(capture) if self._owns_capture else capture
 
-        self._commander_socket = socket.socket()
-        self._commander_socket.connect((host, COMMANDER_PORT))
+        self._pending = PendingCommands()
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._replay_queue: deque[CommandEntry] = deque()
 
-        self._updater_socket = socket.socket()
-        self._updater_socket.connect((host, UPDATER_PORT))
+        # Deadlines of submitted commands as a heap of (deadline, sequence, entry)
+        self._deadlines: list[tuple[float, int, CommandEntry]] = []
+        self._deadline_sequence = 0
+        self._timer_condition = threading.Condition()
+
+        self._commander_socket: socket.socket = None
+        self._commander_decoder: StreamDecoder = None  # May already hold messages read while negotiating
+        self._updater_socket: socket.socket = None  # None while multiplexed
+        self._connected = threading.Event()
+        self._closing = threading.Event()
+        self._generation = 0  # Incremented on every (re)connection
+        self._last_answer = 0.0
+
+        try:
+            self._open_sockets()
+        except OSError as exception:
+            raise ConnectionError(f"Could not connect to {host}") from exception
+
+        self.commander_thread = threading.Thread(target=self._commander_worker, daemon=True)
+        self.commander_thread.start()
+
+        # The updater socket is only ever read into this queue; receivers are called from the dispatcher thread
+        self.update_queue = UpdateQueue(update_queue_size, overflow_policy)
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_worker, daemon=True)
+        self.dispatcher_thread.start()
 
         self.updater_thread: threading.Thread
         self.receiving_updates = True
 
+        self.timer_thread = threading.Thread(target=self._timer_worker, daemon=True)
+        self.timer_thread.start()
+
     def __del__(self) -> None:
+        self._closing.set()
         self._receiving_updates = False
-        self._updater_socket.close()
-        self._commander_socket.close()
+        for connection in [self._updater_socket, self._commander_socket]:
+            if connection is not None:
+                connection.close()
 
-    def execute(self, command_name: str, **kwargs) -> dict:
-        # Load command into JSON format
-        command = json.dumps({"command": command_name, "kwargs": {**kwargs}}) + "\n"
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
 
-        # Dispatch command to server
-        self._commander_socket.send(command.encode())
+    def execute_within(self, timeout: float, command_name: str, **kwargs) -> dict:
+        # As execute, but answers with a TIMEOUT error if no response arrives within the given number of seconds
+        def fetch(name: str, arguments: dict) -> dict:
+            return wait_for_response(self.submit(name, arguments), deadline_after(timeout))
 
-        # Await response
-        response = self._commander_socket.recv(BUFFER_SIZE)
+        return self._execute_cached(command_name, kwargs, fetch)
+
+    def execute_many(self, commands: CommandBatch) -> list[dict]:
+        deadline = deadline_after(self.timeout)
+        return [wait_for_response(future, deadline) for future in self.submit_many(commands)]
+
+    def submit(self, command_name: str, kwargs: dict = None, callback: ResponseCallback = None,
+               timeout: float = None) -> Future:
+        # Dispatches a command without waiting on its response; any number of commands may be in flight at once
+        future = self.submit_many([(command_name, kwargs)], timeout)[0]
+        if callback is not None:
+            future.add_done_callback(lambda done: None if done.cancelled() else callback(done.result()))
+
+        return future
+
+    def submit_many(self, commands: CommandBatch, timeout: float = None) -> list[Future]:
+        # Serializes the whole batch into a single write so it costs one round trip
+        # Futures resolve to a TIMEOUT error after the timeout, and may be cancelled while unanswered
+        entries = [CommandEntry(command_name, kwargs) for command_name, kwargs in commands]
+        for entry in entries:
+            entry.future.add_done_callback(lambda _, entry=entry: self._forget(entry))
+            entry.future.add_done_callback(
+                lambda done, entry=entry: self._record_result(entry.command_name, entry.submitted, done)
+            )
+            if self.response_cache is not None:
+                self.response_cache.command_sent(entry.command_name)
+
+        failed = []
+        with self._send_lock:
+            if self._connected.is_set():
+                failed = self._send_locked(entries)
+            elif self.reconnect and not self._closing.is_set():
+                # Held until the connection comes back, then replayed in order
+                space = max(0, self.replay_limit - len(self._replay_queue))
+                self._replay_queue.extend(entries[:space])
+                failed = entries[space:]
+            else:
+                raise ConnectionError("Interface is not connected")
+
+        if timeout is not None:
+            self._schedule_deadlines(entries, deadline_after(timeout))
+
+        self._fail(failed, ConnectionError("Replay queue is full"))
+        return [entry.future for entry in entries]
+
+    def cancel_all(self) -> int:
+        # Cancels every unanswered command, returning how many were cancelled
+        with self._send_lock:
+            with self._pending_lock:
+                entries = self._pending.clear()
+            entries.extend(self._replay_queue)
+            self._replay_queue.clear()
+
+        return sum(entry.future.cancel() for entry in entries)
 
-        #Ensure response is valid dictionary JSON
-        try:
-            json_response = json.loads(response)
-            if "response" not in json_response.keys():
-                json_response["response"] = "VOID"
-            return json_response
-
-        except json.JSONDecodeError:
-            return {
-                "response": "ERR",
-                "error_code": error_code["BAD_JSON"],
-                "source": response,
-            }
-    
     def quit(self):
-        for socket in [self._commander_socket, self._updater_socket]:
-            socket.close()
+        self._closing.set()
+        with self._timer_condition:
+            self._timer_condition.notify()
+
+        with self._send_lock:
+            failed = self._drop_locked()
+        self._fail(failed, ConnectionError("Interface closed"))
+        self.update_queue.close()
         self.receiving_updates = False
+        if self._owns_capture:
+            self.capture.close()
 
     @RemoteInterfaceHeader.receiving_updates.setter
     def receiving_updates(self, value: bool) -> None:
@@ -116,15 +475,390 @@ class RemoteInterface(RemoteInterfaceHeader):
         if self._receiving_updates:
             self.updater_thread = threading.Thread(target=self._update_worker)
             self.updater_thread.start()
-        else:
-            self.updater_thread.join()
+        elif threading.current_thread() is not self.updater_thread:
+            # Bounded, as the worker may be stuck in a slow update receiver
+            self.updater_thread.join(QUIT_TIMEOUT)
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        return wait_for_response(self.submit(command_name, kwargs), deadline_after(self.timeout))
+
+    @staticmethod
+    def _fail(entries: list[CommandEntry], exception: Exception) -> None:
+        for entry in entries:
+            try:
+                entry.future.set_exception(exception)
+            except InvalidStateError:
+                pass
+
+    def _forget(self, entry: CommandEntry) -> None:
+        # Stops tracking a command answered locally so a late response is ignored; queued ones are skipped on replay
+        if not entry.ticket:
+            return
+
+        with self._pending_lock:
+            if self._pending.get(entry.ticket) is entry:
+                self._pending.discard(entry.ticket)
+
+    def _schedule_deadlines(self, entries: list[CommandEntry], deadline: float) -> None:
+        with self._timer_condition:
+            for entry in entries:
+                self._deadline_sequence += 1
+                heappush(self._deadlines, (deadline, self._deadline_sequence, entry))
+            self._timer_condition.notify()
+
+    def _open_sockets(self) -> None:
+        commander, decoder, multiplexed = self._open_commander()
+        updater = None
+        if not multiplexed:
+            try:
+                updater = socket.create_connection((self.host, UPDATER_PORT), CONNECT_TIMEOUT)
+            except OSError:
+                commander.close()
+                raise
+
+        for connection in [commander, updater]:
+            if connection is not None:
+                connection.settimeout(None)
+
+        # A multiplexed connection's updates switch codec along with its responses
+        negotiating = self.codec_preference != [JSON_CODEC]
+        if negotiating and updater is not None:
+            # Servers that read the updater socket switch its codec; the others never read it
+            hello = encode_command("negotiate_codec", {"codecs": self.codec_preference})
+            updater.sendall(hello)
+            self.metrics.count_sent(len(hello))
+            if self.capture is not None:
+                self.capture.record(UPDATER_COMMAND, unframe(hello))
+
+        with self._send_lock:
+            self._commander_socket = commander
+            self._commander_decoder = decoder
+            self._updater_socket = updater
+            self.multiplexed = multiplexed
+            self._generation += 1
+            self._last_answer = check_timer()
+            with self._codec_lock:
+                self.codec = json_codec
+            self._connected.set()
+
+            replay = list(self._replay_queue)
+            self._replay_queue.clear()
+            failed = self._send_locked(replay) if replay else []
+            generation = self._generation
+
+        self._fail(failed, ConnectionError("Replay queue is full"))
+        if negotiating:
+            self._negotiate_codec(generation)
+
+    def _open_commander(self) -> tuple[socket.socket, StreamDecoder, bool]:
+        # The commander connection, its decoder, and whether the server agreed to send updates on it too
+        commander = socket.create_connection((self.host, COMMANDER_PORT), CONNECT_TIMEOUT)
+        decoder = StreamDecoder()
+        if not self.multiplex:
+            return commander, decoder, False
+
+        try:
+            return commander, decoder, self._negotiate_transport(commander, decoder)
+        except TimeoutError:
+            # A late answer would be taken for another command's, so the connection is replaced
+            commander.close()
+            return socket.create_connection((self.host, COMMANDER_PORT), CONNECT_TIMEOUT), StreamDecoder(), False
+        except OSError:
+            commander.close()
+            raise
+
+    def _negotiate_transport(self, connection: socket.socket, decoder: StreamDecoder) -> bool:
+        # Awaited, unlike the codec, as the answer decides whether to open the updater port
+        hello = encode_command("negotiate_transport", {"transports": [MULTIPLEXED_TRANSPORT]})
+        connection.sendall(hello)
+        self.metrics.count_sent(len(hello))
+        if self.capture is not None:
+            self.capture.record(COMMAND, unframe(hello))
+
+        deadline = check_timer() + CONNECT_TIMEOUT
+        while True:
+            for message in decoder.messages():
+                # Anything after the answer stays in the decoder for the commander worker
+                if self.capture is not None:
+                    self.capture.record(RESPONSE, message)
+                response = decode_response(message)
+                payload = response.get("payload") if response.get("response") == "DATA" else None
+                return isinstance(payload, dict) and payload.get("transport") == MULTIPLEXED_TRANSPORT
+
+            remaining = deadline - check_timer()
+            if remaining <= 0:
+                raise TimeoutError("No answer to negotiate_transport")
+            connection.settimeout(remaining)
+            received = decoder.receive(connection, BUFFER_SIZE)
+            if not received:
+                raise ConnectionError("Connection closed while negotiating")
+            self.metrics.count_received(received)
+
+    def _negotiate_codec(self, generation: int) -> None:
+        # Not awaited; commands keep going out as JSON until the server agrees, and servers that do not know the
+        # command answer UNRECOGNISED, which leaves the connection in JSON
+        def agree(response: dict) -> None:
+            chosen = (response.get("payload") or {}).get("codec") if response.get("response") == "DATA" else None
+            if chosen in codecs and chosen in self.codec_preference:
+                with self._codec_lock:
+                    if generation == self._generation:
+                        self.codec = codecs[chosen]
+
+        self.submit("negotiate_codec", {"codecs": self.codec_preference}, agree, self.timeout)
+
+    def _send_locked(self, entries: list[CommandEntry]) -> list[CommandEntry]:
+        # Called with the send lock held; returns any commands that had to be abandoned
+        entries = [entry for entry in entries if not entry.future.done()]  # Skips those cancelled while queued
+        with self._pending_lock:
+            batch, tickets, unencodable = self._pending.encode_batch(
+                (entry, lambda ticket, entry=entry: self._encode_entry(entry, ticket)) for entry in entries
+            )
+            for entry, ticket in zip(entries, tickets):
+                entry.ticket = ticket
+        sent = [entry for entry in entries if entry.ticket]
+
+        # Failed outside the pending lock, which the futures' callbacks take
+        for entry, exception in unencodable:
+            self._fail([entry], exception)
+
+        # Dispatch commands to server
+        try:
+            self._commander_socket.sendall(batch)
+            self.metrics.count_sent(len(batch))
+        except OSError:
+            if not self.reconnect:
+                with self._pending_lock:
+                    for entry in sent:
+                        self._pending.discard(entry.ticket)
+                raise
+
+            # Still pending, so dropping the connection queues them for replay
+            return self._drop_locked()
+
+        return []
+
+    def _encode_entry(self, entry: CommandEntry, ticket: int) -> bytes:
+        frame = encode_command(entry.command_name, entry.kwargs, ticket, self.codec, self.command_registry)
+        if self.capture is not None:
+            self.capture.record(COMMAND, unframe(frame))
+        return frame
+
+    def _drop_locked(self) -> list[CommandEntry]:
+        # Called with the send lock held; returns any commands that cannot be replayed
+        if self._connected.is_set():
+            self._connected.clear()
+            for connection in [self._commander_socket, self._updater_socket]:
+                if connection is None:
+                    continue
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                connection.close()
+
+        # Commands in flight may or may not have run; they are replayed, so delivery is at least once
+        with self._pending_lock:
+            in_flight = self._pending.clear()
+        self._replay_queue.extendleft(reversed(in_flight))
+
+        abandoned = []
+        if not self.reconnect or self._closing.is_set():
+            abandoned = list(self._replay_queue)
+            self._replay_queue.clear()
+        while len(self._replay_queue) > self.replay_limit:
+            abandoned.append(self._replay_queue.pop())
+
+        return abandoned
+
+    def _connection_lost(self, generation: int) -> None:
+        with self._send_lock:
+            if generation != self._generation:
+                return  # Already replaced by a newer connection
+            failed = self._drop_locked()
+
+        self._fail(failed, ConnectionError("Connection lost"))
+
+    def _reconnect(self) -> bool:
+        delay = RECONNECT_INITIAL_DELAY
+        while not self._closing.is_set():
+            try:
+                self._open_sockets()
+                return True
+            except OSError:
+                self._closing.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+        return False
+
+    def _receive_multiplexed(self, message: memoryview) -> None:
+        try:
+            decoded = decode_frame(message)
+        except ValueError:
+            decoded = None
+
+        if not isinstance(decoded, dict):
+            return  # Unreadable, and with updates on the same connection not known to be anyone's answer
+
+        if "response" in decoded:
+            if self.capture is not None:
+                self.capture.record(RESPONSE, message)
+            self._resolve(decoded)
+            return
+
+        update = decoded.get(MULTIPLEXED_UPDATE_KEY)
+        if not isinstance(update, dict):
+            return  # Neither an answer nor an update; resolving it would hand the oldest command the wrong answer
+
+        self._last_answer = check_timer()
+        if self.capture is not None:
+            # Recorded unwrapped, as it would have arrived on the updater port
+            self.capture.record(UPDATE, unframe(self.codec.encode(update)))
+        if self._receiving_updates:  # The server keeps sending them regardless
+            self._note_update(update)
+            # Never waits, as the responses behind this update would wait with it; a full BLOCK queue grows instead,
+            # as holding back this connection would hold back the commands of receivers waiting on their answers
+            self.update_queue.put(update, wait=False)
+
+    def _resolve(self, response: dict) -> None:
+        self._last_answer = check_timer()
+        with self._pending_lock:
+            entry = self._pending.resolve(response)
+
+        if entry is not None:
+            settle(entry.future, response)
+
+    def _record_ping(self, future: Future, sent_time: float) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        if future.result().get("error_code") != error_code["TIMEOUT"]:
+            self.rtt = check_timer() - sent_time
+
+    def _check_health(self) -> None:
+        if not self._connected.is_set():
+            return
+
+        generation = self._generation
+        if check_timer() - self._last_answer > self.ping_interval * PING_TOLERANCE:
+            # The socket may look open long after the access point has gone
+            self._connection_lost(generation)
+            return
+
+        sent_time = check_timer()
+        try:
+            ping = self.submit("ping", timeout=self.ping_interval * PING_TOLERANCE)
+        except OSError:
+            return
+        ping.add_done_callback(lambda done: self._record_ping(done, sent_time))
+
+    def _timer_worker(self) -> None:
+        # Expires command deadlines and sends the periodic health ping
+        next_ping = check_timer() + self.ping_interval if self.ping_interval else None
+        while not self._closing.is_set():
+            expired = []
+            with self._timer_condition:
+                now = check_timer()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    expired.append(heappop(self._deadlines)[2])
+
+                if not expired and (next_ping is None or now < next_ping):
+                    wake_times = [time for time in [next_ping, self._deadlines[0][0] if self._deadlines else None]
+                                  if time is not None]
+                    self._timer_condition.wait(min(wake_times) - now if wake_times else None)
+                    continue
+
+            for entry in expired:
+                settle(entry.future, error_response("TIMEOUT"))
+
+            if next_ping is not None and check_timer() >= next_ping:
+                self._check_health()
+                next_ping = check_timer() + self.ping_interval
+
+    def _dispatch_worker(self) -> None:
+        while (update := self.update_queue.get()) is not None or not self.update_queue.closed:
+            if update is None:
+                continue
+            call_receiver(self._deliver_update, update)
+
+    def _commander_worker(self) -> None:
+        while not self._closing.is_set():
+            if not self._connected.is_set() and not self._reconnect():
+                return
+
+            with self._send_lock:
+                connection = self._commander_socket
+                decoder = self._commander_decoder
+                generation = self._generation
+                multiplexed = self.multiplexed
+
+            while True:
+                # Messages first, as negotiating may have read some already
+                for message in decoder.messages():
+                    if multiplexed:
+                        self._receive_multiplexed(message)
+                        continue
+                    if self.capture is not None:
+                        self.capture.record(RESPONSE, message)
+                    self._resolve(decode_response(message))
+
+                try:
+                    received = decoder.receive(connection, BUFFER_SIZE)
+                except OSError:
+                    received = 0
+
+                if not received:
+                    break
+
+                self.metrics.count_received(received)
+
+            self._connection_lost(generation)
+            if not self.reconnect:
+                return
 
     def _update_worker(self) -> None:
         while self._receiving_updates:
-            response = self._updater_socket.recv(BUFFER_SIZE)
+            if not self._connected.wait(RECONNECT_MAX_DELAY):
+                if not self.reconnect or self._closing.is_set():
+                    return
+                continue
 
-            try:
-                json_response = json.loads(response)
-                self._send_update(json_response)
-            except JSONDecodeError:
+            with self._send_lock:
+                connection = self._updater_socket
+                generation = self._generation
+
+            if connection is None:
+                # Multiplexed, so the commander worker reads the updates until a connection that is not
+                while self._receiving_updates and generation == self._generation and self._connected.is_set():
+                    if self._closing.wait(RECONNECT_MAX_DELAY):
+                        return
                 continue
+
+            decoder = StreamDecoder()
+            while self._receiving_updates:
+                try:
+                    received = decoder.receive(connection, BUFFER_SIZE)
+                except OSError:
+                    received = 0
+
+                if not received:
+                    break
+
+                self._last_answer = check_timer()
+                self.metrics.count_received(received)
+                for message in decoder.messages():
+                    if self.capture is not None:
+                        self.capture.record(UPDATE, message)
+                    try:
+                        update = decode_frame(message)
+                    except ValueError:
+                        continue
+                    if not isinstance(update, dict):
+                        continue  # Valid, but not an update
+
+                    self._note_update(update)
+                    self.update_queue.put(update)
+            else:
+                return
+
+            self._connection_lost(generation)
+            if not self.reconnect:
+                return
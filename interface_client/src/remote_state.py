@@ -0,0 +1,88 @@
+# remote_state.py
+# A local mirror of the controller's state, kept current by the update stream so reads never leave the machine
+
+import threading
+from time import perf_counter as check_timer
+from typing import Any, NamedTuple
+
+from remote_interface import RemoteInterfaceHeader
+
+
+class StateEntry(NamedTuple):
+    value: Any
+    version: int  # The state version when the value was last written
+    timestamp: float  # check_timer() when the value was last written
+
+
+class RemoteState:
+    def __init__(self, interface: RemoteInterfaceHeader = None):
+        self.interface: RemoteInterfaceHeader = None
+        self._entries: dict[str, StateEntry] = {}
+        self._version = 0
+        self._condition = threading.Condition()
+
+        if interface is not None:
+            self.attach(interface)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __getitem__(self, key: str) -> Any:
+        return self._entries[key].value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def version(self) -> int:
+        # Incremented by every update folded in
+        return self._version
+
+    def attach(self, interface: RemoteInterfaceHeader) -> None:
+        self.detach()
+        interface.observe_updates(self.fold)
+        self.interface = interface
+
+    def detach(self) -> None:
+        if self.interface is not None:
+            self.interface.stop_observing(self.fold)
+            self.interface = None
+
+    def fold(self, information: dict) -> int:
+        # Applies an update on top of the known state, returning the new version
+        timestamp = check_timer()
+        with self._condition:
+            self._version += 1
+            for key, value in information.items():
+                self._entries[key] = StateEntry(value, self._version, timestamp)
+            self._condition.notify_all()
+            return self._version
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        return default if entry is None else entry.value
+
+    def entry(self, key: str) -> StateEntry:
+        return self._entries.get(key)
+
+    def age(self, key: str) -> float:
+        # Seconds since the key was last written, or None if it never has been
+        entry = self._entries.get(key)
+        return None if entry is None else check_timer() - entry.timestamp
+
+    def snapshot(self) -> tuple[int, dict[str, Any]]:
+        # A consistent copy of every known value, with the version it reflects
+        with self._condition:
+            return self._version, {key: entry.value for key, entry in self._entries.items()}
+
+    def entries(self) -> dict[str, StateEntry]:
+        with self._condition:
+            return dict(self._entries)
+
+    def wait_for_change(self, key: str, past_version: int = 0, timeout: float = None) -> StateEntry:
+        # Blocks until the key is written after the given version; returns None on timeout
+        with self._condition:
+            changed = self._condition.wait_for(
+                lambda: key in self._entries and self._entries[key].version > past_version, timeout
+            )
+            return self._entries[key] if changed else None
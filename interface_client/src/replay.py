@@ -0,0 +1,158 @@
+# replay.py
+# Plays a wire capture back, at its recorded pace, some multiple of it, or as fast as possible
+# Run: python replay.py capture.bin [--speed 4 | --speed 0] [--info] to serve it from a stand-in controller
+
+import asyncio
+from argparse import ArgumentParser
+from collections import Counter, deque
+from time import perf_counter as check_timer
+from time import sleep as wait
+from typing import Iterable, Iterator, AsyncIterator
+
+from capture import CaptureRecord, read_capture, kind_names, SESSION, COMMAND, RESPONSE, UPDATE
+from remote_interface import RemoteInterfaceHeader, COMMANDER_PORT, UPDATER_PORT, error_response
+from server import RemoteServer
+from wire_codec import decode_frame
+
+MAX_SPEED = 0  # A speed of zero replays without any pauses
+
+
+def scheduled(records: Iterable[CaptureRecord], speed: float) -> Iterator[tuple[float, CaptureRecord]]:
+    # Each record with the check_timer() time it is due at
+    # Timestamps of different sessions do not compare, so each session carries on from where the last left off
+    start = None
+    first = 0
+    due = None
+    for record in records:
+        if start is None or record.kind == SESSION:
+            start, first = check_timer() if due is None else due, record.timestamp
+        due = start if speed == MAX_SPEED else start + (record.timestamp - first) / 1e9 / speed
+        yield due, record
+
+
+def paced(records: Iterable[CaptureRecord], speed: float = 1.0) -> Iterator[CaptureRecord]:
+    for due, record in scheduled(records, speed):
+        delay = due - check_timer()
+        if delay > 0:
+            wait(delay)
+        yield record
+
+
+async def paced_async(records: Iterable[CaptureRecord], speed: float = 1.0) -> AsyncIterator[CaptureRecord]:
+    for due, record in scheduled(records, speed):
+        delay = due - check_timer()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield record
+
+
+def replay_updates(records: Iterable[CaptureRecord], interface: RemoteInterfaceHeader, speed: float = 1.0) -> int:
+    # Feeds the captured updates through an interface's update path, as if they had just arrived; returns the count
+    replayed = 0
+    for record in paced(records, speed):
+        if record.kind != UPDATE:
+            continue  # Paced all the same, as sessions set the pace of the updates after them
+        try:
+            update = decode_frame(record.message)
+        except ValueError:
+            continue
+        interface._send_update(update)
+        replayed += 1
+    return replayed
+
+
+class RecordedResponses:  # Answers each command with the responses it got in the capture, in their order
+    def __init__(self, records: Iterable[CaptureRecord]):
+        self._responses: dict[str, deque[dict]] = {}
+        names_by_ticket: dict[int, str] = {}
+        for record in records:
+            if record.kind == SESSION:
+                names_by_ticket.clear()  # Tickets start over with every run
+                continue
+            try:
+                message = decode_frame(record.message)
+            except ValueError:
+                continue
+
+            if record.kind == COMMAND:
+                names_by_ticket[message.get("ticket", 0)] = message.get("command")
+            elif record.kind == RESPONSE:
+                command_name = names_by_ticket.pop(message.pop("ticket", 0), None)
+                if command_name is not None:
+                    self._responses.setdefault(command_name, deque()).append(message)
+
+    def __call__(self, command_name: str, kwargs: dict) -> dict:
+        # Repeats the last response once a command has used up its recorded ones
+        responses = self._responses.get(command_name)
+        if not responses:
+            return error_response("UNRECOGNISED")
+        return responses.popleft() if len(responses) > 1 else responses[0]
+
+
+async def replay_to_server(records: list[CaptureRecord], server: RemoteServer, speed: float = 1.0) -> int:
+    # Publishes the captured updates to the server's clients, answering their commands from the capture too
+    if server.fallback is None:
+        server.fallback = RecordedResponses(records)
+
+    replayed = 0
+    async for record in paced_async(records, speed):
+        if record.kind != UPDATE:
+            continue
+        try:
+            update = decode_frame(record.message)
+        except ValueError:
+            continue
+        server.publish(update)
+        replayed += 1
+    return replayed
+
+
+def describe(records: list[CaptureRecord]) -> dict:
+    kinds = Counter(kind_names.get(record.kind, str(record.kind)) for record in records)
+    nanoseconds = 0  # Summed over the sessions, whose timestamps do not compare
+    first = last = None
+    for record in records:
+        if record.kind == SESSION and first is not None:
+            nanoseconds += last - first
+            first = None
+        if first is None:
+            first = record.timestamp
+        last = record.timestamp
+    if first is not None:
+        nanoseconds += last - first
+    return {"records": len(records), "duration": f"{nanoseconds / 1e9:.3f}s", **kinds}
+
+
+async def main(path: str, speed: float, host: str, wait_for_client: bool) -> None:
+    records = list(read_capture(path))
+    server = RemoteServer(host, COMMANDER_PORT, UPDATER_PORT)
+    await server.start()
+    if wait_for_client:
+        print(f"Waiting for a client on {host}")
+        while not server.client_count:
+            await asyncio.sleep(0.05)
+
+    started = check_timer()
+    replayed = await replay_to_server(records, server, speed)
+    print(f"Replayed {replayed} updates in {check_timer() - started:.3f}s")
+    await server.close()
+
+
+if __name__ == "__main__":
+    from shell import print_payload
+
+    parser = ArgumentParser(description="Wire capture replay")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiple of the recorded pace; 0 is as fast as possible")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--no-wait", action="store_true", help="Start replaying before any client connects")
+    parser.add_argument("--info", action="store_true", help="Only describe the capture")
+    arguments = parser.parse_args()
+
+    if arguments.info:
+        print_payload(describe(list(read_capture(arguments.capture))))
+    else:
+        try:
+            asyncio.run(main(arguments.capture, arguments.speed, arguments.host, not arguments.no_wait))
+        except KeyboardInterrupt:
+            pass
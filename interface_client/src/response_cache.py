@@ -0,0 +1,162 @@
+# response_cache.py
+# Remembers the answers to read-only queries for a short time, so repeated polling does not cost a round trip each
+
+import threading
+from collections import OrderedDict
+from time import perf_counter as check_timer
+from typing import Any, Hashable
+
+CACHE_SIZE = 128
+
+# Seconds a query's answer stays fresh; only commands listed here are ever cached
+DEFAULT_TTLS = {
+    "get_bridge_position": 0.1,
+    "get_light_condition": 0.5,
+}
+
+# Update keys that mean a query's cached answer has gone stale
+DEFAULT_UPDATE_INVALIDATIONS = {
+    "get_bridge_position": ["current_position", "bridge_position", "event"],
+    "get_light_condition": ["bridge_lights", "light_condition", "event"],
+}
+
+# Commands that change what a query answers, besides each set_<name> command invalidating get_<name>
+DEFAULT_COMMAND_INVALIDATIONS = {
+    "set_bridge_position": ["get_bridge_position"],
+    "set_overrides": ["get_light_condition"],
+}
+
+
+def cache_key(command_name: str, kwargs: dict) -> Hashable:
+    # None for arguments that cannot be compared safely, which are then never cached
+    try:
+        key = (command_name, tuple(sorted(kwargs.items())) if kwargs else ())
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+class ResponseCache:
+    def __init__(self, ttls: dict[str, float] = None, max_entries: int = CACHE_SIZE,
+                 update_invalidations: dict[str, list[str]] = None,
+                 command_invalidations: dict[str, list[str]] = None):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+
+        # Indexed by what triggers the invalidation, so checking an update or command is one lookup per key
+        self._queries_by_update_key: dict[str, set[str]] = {}
+        for query, keys in (DEFAULT_UPDATE_INVALIDATIONS if update_invalidations is None else update_invalidations).items():
+            for key in keys:
+                self._queries_by_update_key.setdefault(key, set()).add(query)
+
+        self._queries_by_command: dict[str, set[str]] = {}
+        for command, queries in (DEFAULT_COMMAND_INVALIDATIONS if command_invalidations is None else command_invalidations).items():
+            self._queries_by_command.setdefault(command, set()).update(queries)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries: OrderedDict[Hashable, tuple[float, dict]] = OrderedDict()  # key: (expiry time, response)
+        self._keys_by_command: dict[str, set[Hashable]] = {}
+        self._generations: dict[str, int] = {}  # Bumped on every invalidation of a command
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def lookup(self, command_name: str, kwargs: dict) -> tuple[dict, Any]:
+        # Returns a fresh cached response, or None and a token for storing the response once it arrives
+        # The token is None when the command is not cacheable
+        if command_name not in self.ttls:
+            return None, None
+        key = cache_key(command_name, kwargs)
+        if key is None:
+            return None, None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, response = entry
+                if check_timer() < expiry:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _copy_response(response), None
+                self._remove(key)
+
+            self.misses += 1
+            return None, (key, self._generations.get(command_name, 0))
+
+    def store(self, token: Any, response: dict) -> None:
+        if token is None or response.get("response") not in ("OK", "DATA"):
+            return
+
+        key, generation = token
+        command_name = key[0]
+        with self._lock:
+            if self._generations.get(command_name, 0) != generation:
+                return  # Invalidated while the query was in flight, so the response may already be stale
+
+            self._entries[key] = (check_timer() + self.ttls[command_name], _copy_response(response))
+            self._entries.move_to_end(key)
+            self._keys_by_command.setdefault(command_name, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def command_sent(self, command_name: str) -> None:
+        queries = self._queries_by_command.get(command_name)
+        if command_name.startswith("set_"):
+            related = "get_" + command_name[len("set_"):]
+            queries = {related} | queries if queries else {related}
+        if queries:
+            self.invalidate(queries)
+
+    def update_received(self, information: dict) -> None:
+        queries = set()
+        for key in information:
+            queries.update(self._queries_by_update_key.get(key, ()))
+        if queries:
+            self.invalidate(queries)
+
+    def invalidate(self, command_names: Any = None) -> None:
+        # Forgets the cached responses of the given commands, or of every command
+        with self._lock:
+            if command_names is None:
+                command_names = list(self._keys_by_command)
+            for command_name in command_names:
+                self._generations[command_name] = self._generations.get(command_name, 0) + 1
+                for key in list(self._keys_by_command.get(command_name, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def _remove(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_command.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+
+
+def _copy_response(response: dict) -> dict:
+    # Callers may modify what they are given, so nobody shares the cached dictionaries
+    copy = dict(response)
+    if isinstance(copy.get("payload"), dict):
+        copy["payload"] = dict(copy["payload"])
+    return copy
@@ -0,0 +1,258 @@
+# server.py
+# A Python server speaking the controller's protocol, for exercising and load testing clients without the hardware
+# Run: python server.py [--host 0.0.0.0] [--traffic] to serve a SimulatedInterface on the usual ports
+
+import asyncio
+import inspect
+from argparse import ArgumentParser
+from typing import Callable, Any
+
+from framing import StreamDecoder
+from remote_interface import RemoteInterfaceHeader, BUFFER_SIZE, COMMANDER_PORT, UPDATER_PORT, error_response
+from remote_interface import SEPARATE_TRANSPORT, MULTIPLEXED_TRANSPORT, MULTIPLEXED_UPDATE_KEY
+from wire_codec import WireCodec, json_codec, decode_frame, choose_codec
+
+BACKLOG = 1024  # Pending connections; many clients may connect at once under load tests
+MAX_WRITE_BUFFER = 256 * 1024  # Bytes queued for a client before its updates are dropped instead
+
+CommandHandler: type = Callable[[dict], Any]  # Called with the command's kwargs; returns a response, maybe awaitable
+FallbackHandler: type = Callable[[str, dict], Any]  # Called with the name and kwargs of commands without a handler
+
+
+def acknowledge(kwargs: dict) -> dict:
+    return {"response": "OK"}
+
+
+class UpdateClient:  # A connection to the updater port, or a commander connection multiplexing updates
+    __slots__ = ("writer", "codec", "dropped", "multiplexed")
+
+    def __init__(self, writer: asyncio.StreamWriter, codec: WireCodec = json_codec, multiplexed: bool = False):
+        self.writer = writer
+        self.codec = codec
+        self.dropped = 0
+        self.multiplexed = multiplexed
+
+
+class RemoteServer:
+    def __init__(self, host: str = "0.0.0.0", commander_port: int = COMMANDER_PORT, updater_port: int = UPDATER_PORT,
+                 handlers: dict[str, CommandHandler] = None, fallback: FallbackHandler = None,
+                 multiplexing: bool = True):
+        self.host = host
+        self.commander_port = commander_port
+        self.updater_port = updater_port
+        self.multiplexing = multiplexing  # Whether clients may take their updates on the commander connection
+        self.handlers: dict[str, CommandHandler] = {"ping": acknowledge}
+        self.handlers.update(handlers or {})
+        self.fallback = fallback
+
+        self.commands_handled = 0
+        self.updates_sent = 0
+
+        self._update_clients: set[UpdateClient] = set()
+        self._command_writers: set[asyncio.StreamWriter] = set()
+        self._servers: list[asyncio.AbstractServer] = []
+        self._connection_tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop = None
+
+    @property
+    def client_count(self) -> int:
+        return len(self._command_writers)
+
+    def handler(self, command_name: str) -> Callable[[CommandHandler], CommandHandler]:
+        # Decorator registering the handler of a command
+        def register(handler: CommandHandler) -> CommandHandler:
+            self.handlers[command_name] = handler
+            return handler
+        return register
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._servers = [
+            await asyncio.start_server(self._serve_commander, self.host, self.commander_port, backlog=BACKLOG),
+            await asyncio.start_server(self._serve_updater, self.host, self.updater_port, backlog=BACKLOG),
+        ]
+
+    async def serve_forever(self) -> None:
+        if not self._servers:
+            await self.start()
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+        for writer in list(self._command_writers) + [client.writer for client in self._update_clients]:
+            writer.close()
+        # Closed connections read as ended, so every connection's handler finishes
+        await asyncio.gather(*self._connection_tasks, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    def publish(self, update: dict) -> None:
+        # Sends an update to every connected client; safe to call from any thread
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            self._broadcast(update)
+        else:
+            self._loop.call_soon_threadsafe(self._broadcast, update)
+
+    async def handle(self, command_name: str, kwargs: dict) -> dict:
+        handler = self.handlers.get(command_name)
+        try:
+            if handler is not None:
+                response = handler(kwargs)
+            elif self.fallback is not None:
+                response = self.fallback(command_name, kwargs)
+            else:
+                return error_response("UNRECOGNISED")
+
+            if inspect.isawaitable(response):
+                response = await response
+        except (TypeError, ValueError, KeyError):
+            return error_response("INVALID_ARGS")
+        except Exception:
+            return error_response("INTERNAL_ERROR")
+
+        return response if response is not None else {"response": "VOID"}
+
+    def _broadcast(self, update: dict) -> None:
+        # Encoded once per codec and transport in use, however many clients there are
+        frames: dict[tuple[str, bool], bytes] = {}
+        for client in list(self._update_clients):
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                client.dropped += 1  # A client this far behind would only slow everyone else down
+                continue
+
+            key = (client.codec.name, client.multiplexed)
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = client.codec.encode({MULTIPLEXED_UPDATE_KEY: update} if client.multiplexed
+                                                          else update)
+            client.writer.write(frame)
+            self.updates_sent += 1
+
+    async def _serve_commander(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._command_writers.add(writer)
+        self._connection_tasks.add(asyncio.current_task())
+        codec: WireCodec = json_codec
+        update_client: UpdateClient = None  # Once the client has asked for its updates here
+        decoder = StreamDecoder()
+        try:
+            while received := await reader.read(BUFFER_SIZE):
+                for message in decoder.feed(received):
+                    try:
+                        command = decode_frame(message)
+                        command_name = command["command"]
+                        kwargs = command.get("kwargs") or {}
+                        ticket = command.get("ticket", 0)
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        writer.write(codec.encode(error_response("BAD_JSON")))
+                        continue
+
+                    chosen = None
+                    multiplexing = False
+                    if command_name == "negotiate_codec":
+                        # Answered in the codec in use so far; everything after it uses the chosen one
+                        chosen = choose_codec(kwargs.get("codecs") or [])
+                        response = {"response": "DATA", "payload": {"codec": chosen.name}}
+                    elif command_name == "negotiate_transport":
+                        multiplexing = self.multiplexing and MULTIPLEXED_TRANSPORT in (kwargs.get("transports") or [])
+                        transport = MULTIPLEXED_TRANSPORT if multiplexing else SEPARATE_TRANSPORT
+                        response = {"response": "DATA", "payload": {"transport": transport}}
+                    else:
+                        response = await self.handle(command_name, kwargs)
+
+                    if ticket:
+                        response = {**response, "ticket": ticket}
+                    writer.write(codec.encode(response))
+                    self.commands_handled += 1
+
+                    if chosen is not None:
+                        codec = chosen
+                        if update_client is not None:
+                            update_client.codec = chosen
+                    if multiplexing and update_client is None:
+                        # Updates follow the answer on this connection
+                        update_client = UpdateClient(writer, codec, multiplexed=True)
+                        self._update_clients.add(update_client)
+
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._command_writers.discard(writer)
+            self._update_clients.discard(update_client)
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _serve_updater(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Clients only ever write one thing here: the codec they would like updates in
+        client = UpdateClient(writer)
+        self._update_clients.add(client)
+        self._connection_tasks.add(asyncio.current_task())
+        decoder = StreamDecoder()
+        try:
+            while received := await reader.read(BUFFER_SIZE):
+                for message in decoder.feed(received):
+                    try:
+                        command = decode_frame(message)
+                        if command["command"] == "negotiate_codec":
+                            client.codec = choose_codec(command["kwargs"]["codecs"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except ConnectionError:
+            pass
+        finally:
+            self._update_clients.discard(client)
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+
+
+def serve_interface(interface: RemoteInterfaceHeader, **server_options) -> RemoteServer:
+    # A server answering every command without its own handler from the given interface, and publishing its updates
+    server = RemoteServer(fallback=lambda command_name, kwargs: interface.execute(command_name, **kwargs),
+                          **server_options)
+    interface.update_receiver = server.publish
+    return server
+
+
+async def main(host: str, commander_port: int, updater_port: int, multiplexing: bool = True,
+               traffic: bool = False) -> None:
+    from simulation import SimulatedInterface
+    from traffic_simulation import TrafficSimulatedInterface
+
+    simulation = TrafficSimulatedInterface() if traffic else SimulatedInterface()
+    server = serve_interface(simulation, host=host, commander_port=commander_port, updater_port=updater_port,
+                             multiplexing=multiplexing)
+    await server.start()
+    print(f"Serving a simulated controller on {host}, ports {commander_port} and {updater_port}")
+    try:
+        await server.serve_forever()
+    finally:
+        simulation.quit()
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Simulated controller server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--commander-port", type=int, default=COMMANDER_PORT)
+    parser.add_argument("--updater-port", type=int, default=UPDATER_PORT)
+    parser.add_argument("--no-multiplexing", action="store_true", help="Refuse single-connection clients, like the firmware")
+    parser.add_argument("--traffic", action="store_true", help="Simulate traffic and send its sensor readings too")
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(main(arguments.host, arguments.commander_port, arguments.updater_port,
+                         not arguments.no_multiplexing, arguments.traffic))
+    except KeyboardInterrupt:
+        pass
@@ -103,6 +103,10 @@ if __name__ == "__main__":
                 show_json = False
                 continue
 
+            if command_name.lower() == "stats":
+                print_payload(ri.metrics.summary())
+                continue
+
             response = ri.execute(command_name.lower(), **kwargs)
             
             if show_json:
@@ -1,14 +1,25 @@
 import threading
+from collections import deque
+from math import ceil, floor, log, log1p, lgamma, sqrt
 from tabnanny import check
 from time import perf_counter as check_timer
 from time import sleep as wait
-from random import random
+from random import Random
+import random
+from typing import Sequence
 
 from remote_interface import RemoteInterfaceHeader, UpdateReceiver, error_code
 
+try:
+    import numpy
+except ImportError:  # Batches are sampled one at a time instead
+    numpy = None
+
 SIMULATION_TICK_TIME = 0.01
 YIELD_PAUSE = 3.0
 STOP_PAUSE = 2.0
+EVENT_RESOLUTION = 1000  # Slots per second; each is an independent trial of chance / EVENT_RESOLUTION
+GEOMETRIC_LIMIT = 10  # Expected occurrences up to which skipping between them beats other samplers
 
 def move_towards(current: float, target: float, amount: float):
     difference = target - current
@@ -18,19 +29,131 @@ def move_towards(current: float, target: float, amount: float):
     return current + amount * (difference / distance)
 
 
-def event_simulation(time: float, chance: float) -> int:
-    resolution = 1000
-
-    time *= resolution
-    chance /= resolution
-
-    occurrences  = 0
-
-    for _ in range(round(time)):
-        if random() <= chance:
-            occurrences += 1
-
-    return occurrences
+def event_simulation(time: float, chance: float, rng: Random = None) -> int:
+    # How many events with the given chance per second happen in the given number of seconds
+    # Sampled straight from the binomial distribution of trying every slot, rather than trying each one
+    return _binomial(round(time * EVENT_RESOLUTION), chance / EVENT_RESOLUTION, rng)
+
+
+def event_simulations(times: Sequence[float], chances: float | Sequence[float], rng: Random = None) -> list[int]:
+    # event_simulation for many times at once; chances is one chance for every time, or one per time
+    if numpy is None:
+        rng = rng or random
+        if isinstance(chances, (int, float)):
+            chances = [chances] * len(times)
+        return [_binomial(round(time * EVENT_RESOLUTION), chance / EVENT_RESOLUTION, rng)
+                for time, chance in zip(times, chances, strict=True)]
+
+    # rint rounds halves to even, as round does
+    trials = numpy.maximum(numpy.rint(numpy.asarray(times, dtype=float) * EVENT_RESOLUTION), 0).astype(numpy.int64)
+    probabilities = numpy.clip(numpy.asarray(chances, dtype=float) / EVENT_RESOLUTION, 0.0, 1.0)
+    return _numpy_generator(rng).binomial(trials, probabilities).tolist()
+
+
+def next_event_delay(chance: float, rng: Random = None) -> float:
+    # Seconds until the next of the events event_simulation counts, for models that step from event to event
+    probability = chance / EVENT_RESOLUTION
+    if probability <= 0.0:
+        return float("inf")
+    if probability >= 1.0:
+        return 1 / EVENT_RESOLUTION
+    return (floor(log(1.0 - (rng or random).random()) / log1p(-probability)) + 1) / EVENT_RESOLUTION
+
+
+def _binomial(trials: int, probability: float, rng: Random = None) -> int:
+    # Skips between occurrences while few are expected, and otherwise uses a sampler whose cost does not grow with them
+    if trials <= 0 or probability <= 0.0:
+        return 0
+    if probability >= 1.0:
+        return trials
+    if trials * probability > GEOMETRIC_LIMIT:
+        if _HAS_BINOMIALVARIATE:
+            return (rng or random).binomialvariate(trials, probability)
+        if numpy is not None:
+            return int(_numpy_generator(rng).binomial(trials, probability))
+        if probability > 0.5:
+            return trials - _binomial(trials, 1.0 - probability, rng)
+        return _transformed_rejection(trials, probability, rng or random)
+
+    # Skips from one occurrence straight to the next; the gap between them is geometrically distributed,
+    # so this costs one random number per occurrence rather than one per trial
+    rng = rng or random
+    log_miss = log1p(-probability)
+    occurrences = 0
+    remaining = trials
+    while True:
+        gap = log(1.0 - rng.random()) / log_miss  # Misses before the next occurrence
+        if gap >= remaining:
+            return occurrences
+        occurrences += 1
+        remaining -= int(gap) + 1
+
+
+def _transformed_rejection(trials: int, probability: float, rng: Random) -> int:
+    # Hormann's BTRS, as random.binomialvariate uses from Python 3.12; needs probability <= 0.5 and at least ten
+    # expected occurrences, and takes about one try whatever the number of trials
+    deviation = sqrt(trials * probability * (1.0 - probability))
+    b = 1.15 + 2.53 * deviation
+    a = -0.0873 + 0.0248 * b + 0.01 * probability
+    c = trials * probability + 0.5
+    squeeze = 0.92 - 4.2 / b
+
+    alpha = (2.83 + 5.1 / b) * deviation
+    log_odds = log(probability / (1.0 - probability))
+    mode = floor((trials + 1) * probability)
+    h = lgamma(mode + 1) + lgamma(trials - mode + 1)
+    while True:
+        u = rng.random() - 0.5
+        us = 0.5 - abs(u)
+        k = floor((2.0 * a / us + b) * u + c)
+        if k < 0 or k > trials:
+            continue
+
+        v = rng.random()
+        if us >= 0.07 and v <= squeeze:
+            return k  # Inside the squeeze, so accepted without working out the distribution
+        v *= alpha / (a / (us * us) + b)
+        if log(v) <= h - lgamma(k + 1) - lgamma(trials - k + 1) + (k - mode) * log_odds:
+            return k
+
+
+_HAS_BINOMIALVARIATE = hasattr(Random, "binomialvariate")  # Python 3.12 onwards; constant time for many occurrences
+_numpy_rng = numpy.random.default_rng() if numpy is not None else None
+
+
+def _numpy_generator(rng: Random) -> "numpy.random.Generator":
+    # Seeded from the given generator so seeded runs repeat; otherwise one shared generator
+    return _numpy_rng if rng is None else numpy.random.default_rng(rng.getrandbits(64))
+
+
+class Clock:  # Real time
+    def now(self) -> float:
+        return check_timer()
+
+    def sleep(self, seconds: float) -> None:
+        wait(max(0.0, seconds))
+
+    def wait_on(self, condition: threading.Condition, seconds: float = None) -> None:
+        # Waits for the condition to be notified, for at most the given seconds of this clock's time
+        condition.wait(None if seconds is None else max(0.0, seconds))
+
+
+class VirtualClock(Clock):  # Time that passes only when slept through, so a simulation paced by it runs flat out
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+    def sleep(self, seconds: float) -> None:
+        self.time += max(0.0, seconds)
+
+    def wait_on(self, condition: threading.Condition, seconds: float = None) -> None:
+        # Nothing is going to notify sooner than no time at all, so only an endless wait waits
+        if seconds is None:
+            condition.wait()
+        else:
+            self.sleep(seconds)
 
 
 def acknowledgement() -> dict:
@@ -42,26 +165,12 @@ def error(error_type: str) -> dict:
 
 
 def data(payload: dict) -> dict:
-    return {"resposne": "DATA", "payload": payload}
-
-class SimulatedInterface(RemoteInterfaceHeader):
-    def __init__(self, update_receiver: UpdateReceiver = None):
-        super().__init__(update_receiver)
-        self.receiving_updates = True
-
-        self.bridge_position = 0.0
-        self.bridge_target_position = 0.0
-        self.bridge_speed = 0.2
-
-        self.light_condition = "GO"
-
-        self.overrides_enabled = False
-
-        self._simulating = True
-        simulation = threading.Thread(target=self._simulate)
-        simulation.start()
+    return {"response": "DATA", "payload": payload}
 
-    def execute(self, command_name: str, **kwargs) -> dict:
+class SimulatedCommands:
+    # The controller's commands, answered from the bridge_position, bridge_target_position, light_condition and
+    # overrides_enabled attributes; shared by SimulatedInterface and the fleet's SimulatedBridge
+    def _apply_command(self, command_name: str, kwargs: dict) -> dict:
         if command_name == "ping":
             return acknowledgement()
 
@@ -73,7 +182,7 @@ class SimulatedInterface(RemoteInterfaceHeader):
                 return error("INVALID_ARGS")
             try:
                 self.bridge_target_position = float(kwargs["position"])
-                self._send_update({"event": f"Bridge target position set to {self.bridge_target_position}"})
+                self._emit({"event": f"Bridge target position set to {self.bridge_target_position}"})
                 return acknowledgement()
             except ValueError:
                 return error("INVALID_ARGS")
@@ -95,25 +204,177 @@ class SimulatedInterface(RemoteInterfaceHeader):
             return acknowledgement()
 
         if command_name == "set_overrides":
-            try:
-                self.overrides_enabled = bool(kwargs["enabled"])
-            except ValueError:
+            # Takes "to" like the firmware; "enabled" is still accepted
+            enabled = kwargs.get("to", kwargs.get("enabled"))
+            if enabled is None:
                 return error("INVALID_ARGS")
+            self.overrides_enabled = bool(enabled)
 
             return acknowledgement()
 
         return error("UNRECOGNISED")
 
-    def quit(self):
+    def _emit(self, information: dict) -> None:
+        raise NotImplementedError("Update method not defined")
+
+
+class SimulatedInterface(SimulatedCommands, RemoteInterfaceHeader):
+    # Simulated in fixed frames of tick seconds, so a seeded run turns out the same however fast it is stepped
+    # Frames are kept up with the clock on a thread of their own, unless start is False and they are stepped by hand
+    # The thread sleeps until the next update is due or a command arrives; frames in between are run when anything
+    # looks at the state, and skipped outright while nothing can change
+    def __init__(self, update_receiver: UpdateReceiver = None, clock: Clock = None, seed: int = None,
+                 tick: float = SIMULATION_TICK_TIME, start: bool = True):
+        super().__init__(update_receiver)
+        self.receiving_updates = True
+        self.clock = clock or Clock()
+        self.random = Random(seed)  # For anything left to chance, e.g. event_simulation(..., rng=self.random)
+        self.tick = tick
+        self.frames = 0
+
+        # Held while the state changes or is read; updates made meanwhile are sent once it is let go
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+        self._outbox: deque[dict] = deque()
+        self._send_lock = threading.RLock()  # Keeps updates in order when several threads send them
+
+        self.bridge_position = 0.0
+        self.bridge_target_position = 0.0
+        self.bridge_speed = 0.2
+
+        self.light_condition = "GO"
+
+        self.overrides_enabled = False
+
         self._simulating = False
+        if start:
+            self.start()
+
+    @property
+    def time(self) -> float:
+        # Seconds simulated so far
+        return self.frames * self.tick
+
+    def start(self) -> None:
+        # Starts keeping frames up with the clock, for simulations made with start=False
+        with self._lock:
+            self._simulating = True
+            self._origin = (self.clock.now(), self.frames)  # When the thread started, and the frame it started at
+        simulation = threading.Thread(target=self._simulate, daemon=True)
+        simulation.start()
+
+    def step(self, frames: int = 1) -> None:
+        # Updates are sent as soon as the frame that made them has run
+        while frames > 0:
+            with self._lock:
+                frames -= self._advance(frames, until_update=True)
+            self._send_outbox()
+
+    def run_for(self, seconds: float) -> None:
+        # As fast as possible, e.g. a ten minute scenario with run_for(600)
+        self.step(round(seconds / self.tick))
+
+    def snapshot(self) -> dict:
+        # The whole state at one instant, as of now
+        with self._lock:
+            self._catch_up()
+            state = {
+                "time": self.time,
+                "bridge_position": self.bridge_position,
+                "bridge_target_position": self.bridge_target_position,
+                "bridge_speed": self.bridge_speed,
+                "light_condition": self.light_condition,
+                "overrides_enabled": self.overrides_enabled,
+            }
+        self._send_outbox()
+        return state
+
+    def _execute(self, command_name: str, kwargs: dict) -> dict:
+        with self._condition:
+            self._catch_up()
+            response = self._apply_command(command_name, kwargs)
+            self._condition.notify()  # The next update may now be due sooner, or at all
+        self._send_outbox()
+        return response
+
+    def quit(self):
+        # The state left behind is as of quitting
+        with self._condition:
+            self._catch_up()
+            self._simulating = False
+            self._condition.notify()
+        self._send_outbox()
 
     def _simulate(self):
-        last_time = 0.0
-        while self._simulating:
-            time = check_timer()
-            self._simulate_frame(time - last_time)
-            last_time = time
-            wait(SIMULATION_TICK_TIME)
+        while True:
+            with self._condition:
+                if not self._simulating:
+                    return
+                self._catch_up()
+                if not self._outbox:
+                    due = self._next_update_frame()
+                    self.clock.wait_on(self._condition, None if due is None else self._time_of(due) - self.clock.now())
+                    continue
+            self._send_outbox()
+
+    def _time_of(self, frame: int) -> float:
+        # When the thread runs the given frame
+        origin_time, origin_frame = self._origin
+        return origin_time + (frame - origin_frame - 1) * self.tick
+
+    def _catch_up(self) -> None:
+        # Runs the frames the clock says are due; called with the lock held
+        if not self._simulating:
+            return
+        origin_time, origin_frame = self._origin
+        due = origin_frame + floor((self.clock.now() - origin_time) / self.tick) + 1
+        if due > self.frames:
+            self._advance(due - self.frames)
+
+    def _advance(self, frames: int, until_update: bool = False) -> int:
+        # Called with the lock held; returns how many frames were run, fewer if stopped by an update
+        run = 0
+        while run < frames:
+            if self._settled():
+                run += self._skip(frames - run)
+            else:
+                self._simulate_frame(self.tick)
+                self.frames += 1
+                run += 1
+            if until_update and self._outbox:
+                break
+        return run
+
+    def _skip(self, frames: int) -> int:
+        # Passes over frames while settled; returns how many, fewer if something else happens in the meantime
+        self.frames += frames
+        return frames
+
+    def _settled(self) -> bool:
+        # Whether frames would change nothing until a command does
+        if self.bridge_position != self.bridge_target_position:
+            return False
+        return self.overrides_enabled or self.light_condition == ("GO" if self.bridge_position == 0.0 else "STOP")
+
+    def _next_update_frame(self) -> int:
+        # The frame an update is next sent in without any command, or None if none will be
+        if self.bridge_position == self.bridge_target_position or self.bridge_speed * self.tick <= 0.0:
+            return None
+        distance = abs(self.bridge_target_position - self.bridge_position)
+        return self.frames + max(1, ceil(distance / (self.bridge_speed * self.tick)))
+
+    def _emit(self, information: dict) -> None:
+        self._outbox.append(information)
+
+    def _send_outbox(self) -> None:
+        # One at a time, so updates made by a receiver's own commands go out after those already waiting
+        with self._send_lock:
+            while True:
+                with self._lock:
+                    if not self._outbox:
+                        return
+                    update = self._outbox.popleft()
+                self._send_update(update)
 
     def _simulate_frame(self, delta: float) -> None:
         self._simulate_bridge_movement(delta)
@@ -135,4 +396,4 @@ class SimulatedInterface(RemoteInterfaceHeader):
 
         if self.bridge_position != original_bridge_position:
             if self.bridge_position == self.bridge_target_position:
-                self._send_update({"event": "Bridge reached target position"})
+                self._emit({"event": "Bridge reached target position"})
@@ -0,0 +1,274 @@
+# traffic_simulation.py
+# Road and river traffic at a simulated bridge, feeding the input traffic sensors the ControlPanel shows
+# Vehicles cross while the bridge is down with the lights at GO, vessels pass under it once it is fully raised
+# Run: python traffic_simulation.py --days 7 for a week of traffic under a simple operator, with its statistics
+
+from argparse import ArgumentParser
+from collections import deque
+from heapq import heappush, heappop
+from math import ceil
+from random import Random
+from time import perf_counter as check_timer
+from typing import Callable
+
+from remote_interface import RemoteInterfaceHeader, UpdateReceiver
+from simulation import SimulatedInterface, Clock, next_event_delay, SIMULATION_TICK_TIME
+
+TRAFFIC_SYSTEMS = ("bridge", "waterway")  # As ControlPanel's, for road and river traffic
+TRAFFIC_SIDES = ("a_side", "b_side")
+SENSORS = {system: (f"{system}_a_side", f"{system}_crossing", f"{system}_b_side") for system in TRAFFIC_SYSTEMS}
+
+ARRIVAL_RATES = {"bridge": 0.1, "waterway": 1 / 1200}  # Arrivals per second at each side
+HEADWAYS = {"bridge": 2.0, "waterway": 30.0}  # Seconds between one leaving a queue and the next following it
+CROSSING_TIMES = {"bridge": 6.0, "waterway": 60.0}  # Seconds from leaving a queue to clearing the crossing
+VESSEL_CLEARANCE = 1.0  # Bridge position vessels need to pass under
+
+ARRIVAL, RELEASE, CLEARED = 0, 1, 2  # Kinds of event
+
+
+class TrafficModel:
+    # Arrivals at either side queue until their way is open, then leave one headway apart and take a while to cross
+    # Runs from event to event on a heap, so days of traffic cost as many steps as there are vehicles and vessels
+    def __init__(self, rates: dict[str, float] = None, rng: Random = None, start: float = 0.0):
+        self.rates = {**ARRIVAL_RATES, **(rates or {})}
+        self.random = rng or Random()
+        self.now = start
+        self.sensors = {key: False for keys in SENSORS.values() for key in keys}
+        self.open = dict.fromkeys(TRAFFIC_SYSTEMS, False)
+
+        # Heap of (time, sequence, kind, system, side); the sequence keeps events at the same time in order
+        self._events: list[tuple[float, int, int, str, str]] = []
+        self._sequence = 0
+        self._queues = {(system, side): deque() for system in TRAFFIC_SYSTEMS for side in TRAFFIC_SIDES}
+        self._next_release = dict.fromkeys(self._queues, start)
+        self._release_pending: set[tuple[str, str]] = set()
+        self._crossing = dict.fromkeys(TRAFFIC_SYSTEMS, 0)
+
+        self._start = start
+        self._arrivals = dict.fromkeys(TRAFFIC_SYSTEMS, 0)
+        self._crossed = dict.fromkeys(TRAFFIC_SYSTEMS, 0)
+        self._waiting = dict.fromkeys(TRAFFIC_SYSTEMS, 0)
+        self._total_wait = dict.fromkeys(TRAFFIC_SYSTEMS, 0.0)
+        self._max_wait = dict.fromkeys(TRAFFIC_SYSTEMS, 0.0)
+        self._max_queue = dict.fromkeys(TRAFFIC_SYSTEMS, 0)
+        self._queue_area = dict.fromkeys(TRAFFIC_SYSTEMS, 0.0)  # Queue length integrated over time
+
+        for system, side in self._queues:
+            self._schedule_arrival(system, side)
+
+    def next_event_time(self) -> float:
+        return self._events[0][0] if self._events else None
+
+    def run_until(self, time: float, bridge_position: float, light_condition: str,
+                  emit: Callable[[dict], None] = None, stop_at_update: bool = False) -> float:
+        # Runs the events up to and including time with the bridge held as given, passing sensor changes to emit
+        # Returns the time run to, which is that of the first sensor change instead if stop_at_update
+        ways = {"bridge": bridge_position == 0.0 and light_condition == "GO",
+                "waterway": bridge_position >= VESSEL_CLEARANCE}
+        if ways != self.open:
+            changed = False
+            for system in TRAFFIC_SYSTEMS:
+                if ways[system] and not self.open[system]:
+                    self.open[system] = True
+                    for side in TRAFFIC_SIDES:
+                        self._release(system, side)
+                    changed = self._sense(system, emit) or changed
+                self.open[system] = ways[system]
+            if changed and stop_at_update:
+                return self.now
+
+        events = self._events
+        while events and events[0][0] <= time:
+            at, _, kind, system, side = heappop(events)
+            self._account(at)
+            if kind == ARRIVAL:
+                queue = self._queues[system, side]
+                queue.append(at)
+                self._arrivals[system] += 1
+                self._waiting[system] += 1
+                self._max_queue[system] = max(self._max_queue[system], len(queue))
+                self._schedule_arrival(system, side)
+                self._release(system, side)
+            elif kind == RELEASE:
+                self._release_pending.discard((system, side))
+                self._release(system, side)
+            else:
+                self._crossing[system] -= 1
+
+            if self._sense(system, emit) and stop_at_update:
+                return at
+
+        self._account(time)
+        return time
+
+    def statistics(self) -> dict:
+        # Per system, over the time run so far: throughput per hour, waits in seconds and queue lengths
+        elapsed = self.now - self._start
+        return {system: {
+            "arrivals": self._arrivals[system],
+            "crossed": self._crossed[system],
+            "waiting": self._waiting[system],
+            "per_hour": self._crossed[system] * 3600 / elapsed if elapsed else 0.0,
+            "mean_wait": self._total_wait[system] / self._crossed[system] if self._crossed[system] else 0.0,
+            "max_wait": self._max_wait[system],
+            "mean_queue": self._queue_area[system] / elapsed if elapsed else 0.0,
+            "max_queue": self._max_queue[system],
+        } for system in TRAFFIC_SYSTEMS}
+
+    def _push(self, time: float, kind: int, system: str, side: str) -> None:
+        self._sequence += 1
+        heappush(self._events, (time, self._sequence, kind, system, side))
+
+    def _schedule_arrival(self, system: str, side: str) -> None:
+        # Spaced as event_simulation counts them, so either gives the same traffic for the same rate
+        delay = next_event_delay(self.rates[system], self.random)
+        if delay != float("inf"):
+            self._push(self.now + delay, ARRIVAL, system, side)
+
+    def _release(self, system: str, side: str) -> None:
+        # Lets the front of a queue go if its way is open and the one before it is far enough ahead
+        key = (system, side)
+        queue = self._queues[key]
+        if not queue or not self.open[system] or key in self._release_pending:
+            return
+        if self._next_release[key] > self.now:
+            self._push(self._next_release[key], RELEASE, system, side)
+            self._release_pending.add(key)
+            return
+
+        wait = self.now - queue.popleft()
+        self._waiting[system] -= 1
+        self._crossed[system] += 1
+        self._total_wait[system] += wait
+        self._max_wait[system] = max(self._max_wait[system], wait)
+
+        self._crossing[system] += 1
+        self._push(self.now + CROSSING_TIMES[system], CLEARED, system, side)
+        self._next_release[key] = self.now + HEADWAYS[system]
+        if queue:
+            self._push(self._next_release[key], RELEASE, system, side)
+            self._release_pending.add(key)
+
+    def _account(self, time: float) -> None:
+        elapsed = time - self.now
+        if elapsed > 0.0:
+            for system in TRAFFIC_SYSTEMS:
+                self._queue_area[system] += self._waiting[system] * elapsed
+            self.now = time
+
+    def _sense(self, system: str, emit: Callable[[dict], None]) -> bool:
+        # Sends the sensors of a system that read differently now; returns whether any did
+        a_side, crossing, b_side = SENSORS[system]
+        readings = {a_side: bool(self._queues[system, "a_side"]), crossing: self._crossing[system] > 0,
+                    b_side: bool(self._queues[system, "b_side"])}
+        changed = {key: value for key, value in readings.items() if self.sensors[key] != value}
+        if not changed:
+            return False
+        self.sensors.update(changed)
+        if emit is not None:
+            emit(changed)
+        return True
+
+
+class TrafficSimulatedInterface(SimulatedInterface):
+    # A SimulatedInterface with traffic at its bridge, sending each sensor change as an update,
+    # e.g. {"bridge_a_side": True, "bridge_crossing": False}
+    # Seeded runs repeat, traffic included; while the bridge is settled, frames are skipped from event to event
+    def __init__(self, update_receiver: UpdateReceiver = None, clock: Clock = None, seed: int = None,
+                 tick: float = SIMULATION_TICK_TIME, start: bool = True, rates: dict[str, float] = None):
+        super().__init__(update_receiver, clock, seed, tick, start=False)
+        self.traffic = TrafficModel(rates, self.random, self.time)
+        if start:
+            self.start()
+
+    def _simulate_frame(self, delta: float) -> None:
+        super()._simulate_frame(delta)
+        self.traffic.run_until((self.frames + 1) * self.tick, self.bridge_position, self.light_condition, self._emit)
+
+    def _skip(self, frames: int) -> int:
+        # Only as far as the frame of the next sensor change, so it is sent when it happens; none at all if that is
+        # this frame again, which still gets on since every stop passes one event
+        end = self.frames + frames
+        reached = self.traffic.run_until(end * self.tick, self.bridge_position, self.light_condition, self._emit,
+                                         stop_at_update=True)
+        skipped = min(frames, max(0, ceil(reached / self.tick) - self.frames))
+        self.frames += skipped
+        return skipped
+
+    def _next_update_frame(self) -> int:
+        frame = super()._next_update_frame()
+        due = self.traffic.next_event_time()
+        if due is not None:
+            # Not every event changes a sensor, but waking for one that does not costs little
+            traffic_frame = max(self.frames + 1, ceil(due / self.tick))
+            frame = traffic_frame if frame is None else min(frame, traffic_frame)
+        return frame
+
+
+# Operator states
+ROAD_OPEN, CLEARING, RAISING, WATERWAY_OPEN, LOWERING = "road open", "clearing", "raising", "waterway open", "lowering"
+
+
+class BridgeOperator:
+    # Opens the bridge for vessels from the sensor updates alone: stops the road, waits for it to clear, raises the
+    # bridge, and lowers it once the waterway is empty again. A stand-in for the controller's own sequencing
+    def __init__(self, interface: RemoteInterfaceHeader):
+        self.interface = interface
+        self.state = ROAD_OPEN
+        self.sensors = {key: False for keys in SENSORS.values() for key in keys}
+        self.openings = 0
+
+        interface.execute("set_overrides", to=True)
+        interface.execute("set_light_condition", light_condition="GO")
+        self.subscription = interface.subscribe(self.update)
+
+    def update(self, information: dict) -> None:
+        for key in self.sensors.keys() & information.keys():
+            self.sensors[key] = information[key]
+        reached = information.get("event") == "Bridge reached target position"
+        vessels = any(self.sensors[key] for key in SENSORS["waterway"])
+
+        # Each state is taken before its command, as the command's own updates come back through here
+        if self.state == RAISING and reached:
+            self.state = WATERWAY_OPEN
+        elif self.state == LOWERING and reached:
+            self.state = ROAD_OPEN
+            self.interface.execute("set_light_condition", light_condition="GO")
+
+        if self.state == ROAD_OPEN and vessels:
+            self.state = CLEARING
+            self.interface.execute("set_light_condition", light_condition="STOP")
+        if self.state == CLEARING and not self.sensors["bridge_crossing"]:
+            self.state = RAISING
+            self.openings += 1
+            self.interface.execute("set_bridge_position", position=VESSEL_CLEARANCE)
+        elif self.state == WATERWAY_OPEN and not vessels:
+            self.state = LOWERING
+            self.interface.execute("set_bridge_position", position=0.0)
+
+    def quit(self) -> None:
+        self.interface.unsubscribe(self.subscription)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Days of traffic at a simulated bridge, as fast as they will run")
+    parser.add_argument("--days", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--vehicle-rate", type=float, default=ARRIVAL_RATES["bridge"], help="per second per side")
+    parser.add_argument("--vessel-rate", type=float, default=ARRIVAL_RATES["waterway"], help="per second per side")
+    arguments = parser.parse_args()
+
+    simulation = TrafficSimulatedInterface(seed=arguments.seed, start=False,
+                                           rates={"bridge": arguments.vehicle_rate, "waterway": arguments.vessel_rate})
+    operator = BridgeOperator(simulation)
+    started = check_timer()
+    simulation.run_for(arguments.days * 86400)
+    elapsed = check_timer() - started
+
+    print(f"{arguments.days:g} days simulated in {elapsed:.2f} s, bridge opened {operator.openings} times\n")
+    statistics = simulation.traffic.statistics()
+    print(f"{'':<20}" + "".join(f"{system:>12}" for system in TRAFFIC_SYSTEMS))
+    for name in statistics["bridge"]:
+        values = [statistics[system][name] for system in TRAFFIC_SYSTEMS]
+        print(f"{name:<20}" + "".join(f"{value:>12.2f}" if isinstance(value, float) else f"{value:>12}"
+                                      for value in values))
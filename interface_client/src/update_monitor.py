@@ -17,7 +17,7 @@ def receive(information: dict) -> None:
         switch_on = information.get("switch_on")
         if isinstance(switch_on, bool):
             gpio_value = 1 if switch_on else 0
-            ri.execute("set_light", to=gpio_value)
+            ri.submit("set_light", {"to": gpio_value})  # Not awaited, so updates keep flowing
 
     print(f"({now()})")
     print_payload(information)
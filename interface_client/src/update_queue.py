@@ -0,0 +1,104 @@
+# update_queue.py
+# Decouples the socket reading updates from whoever consumes them, so a slow consumer cannot stall the network
+
+import threading
+from collections import deque
+from typing import Any
+
+UPDATE_QUEUE_SIZE = 256
+
+# What a full queue does with another update
+# Updates are partial changes and one-off events, so only BLOCK is lossless; dropping loses whatever the dropped
+# update carried, e.g. a "Bridge reached target position" event, until the same keys happen to be sent again
+BLOCK = "block"  # The reader waits for room, pushing back on the sender through TCP
+DROP_OLDEST = "drop_oldest"  # The oldest queued update is discarded, for consumers that only want recent updates
+DROP_NEWEST = "drop_newest"  # The incoming update is discarded
+
+OVERFLOW_POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST]
+
+
+class UpdateQueue:
+    def __init__(self, maxsize: int = UPDATE_QUEUE_SIZE, overflow: str = BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        if maxsize < 1:
+            raise ValueError("Update queue needs room for at least one update")
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self.queued = 0  # Updates accepted into the queue
+        self.delivered = 0  # Updates taken out by a consumer
+        self.dropped = 0  # Updates discarded by the overflow policy
+
+        self._updates = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._updates)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "waiting": len(self._updates),
+        }
+
+    def full(self) -> bool:
+        return len(self._updates) >= self.maxsize
+
+    def put(self, update: Any, wait: bool = True) -> bool:
+        # Returns whether the update was queued
+        # Without wait, a full BLOCK queue takes the update anyway; for readers that must never stop, and so have to
+        # push back some other way
+        with self._lock:
+            if self._closed:
+                return False
+
+            if len(self._updates) >= self.maxsize:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+
+                if self.overflow == DROP_OLDEST:
+                    self._updates.popleft()
+                    self.dropped += 1
+
+                elif wait:
+                    while len(self._updates) >= self.maxsize and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return False
+
+            self._updates.append(update)
+            self.queued += 1
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout: float = None) -> Any:
+        # Returns None once closed and empty, or if nothing arrives before the timeout
+        with self._lock:
+            if not self._updates and not self._closed:
+                self._not_empty.wait(timeout)
+            if not self._updates:
+                return None
+
+            update = self._updates.popleft()
+            self.delivered += 1
+            self._not_full.notify()
+            return update
+
+    def close(self) -> None:
+        # Queued updates can still be taken, but no more are accepted and nobody is left waiting
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
@@ -0,0 +1,94 @@
+# update_router.py
+# Hands each update only to the handlers interested in its keys, instead of every handler checking every key
+
+import threading
+from typing import Any, Callable, Iterable
+
+UpdateHandler: type = Callable[[dict], Any]
+
+
+class Subscription:
+    # Interest in some keys, in keys starting with some prefixes, or with neither, in everything
+    __slots__ = ("handler", "keys", "prefixes")
+
+    def __init__(self, handler: UpdateHandler, keys: Iterable[str] = None, prefixes: Iterable[str] = None):
+        self.handler = handler
+        self.keys = frozenset(keys or ())
+        self.prefixes = frozenset(prefixes or ())
+
+    @property
+    def everything(self) -> bool:
+        return not self.keys and not self.prefixes
+
+    def __repr__(self) -> str:
+        interest = "everything" if self.everything else ", ".join(
+            sorted(self.keys) + [prefix + "*" for prefix in sorted(self.prefixes)])
+        return f"Subscription({getattr(self.handler, '__name__', self.handler)}: {interest})"
+
+
+class UpdateRouter:
+    def __init__(self):
+        self._subscriptions: list[Subscription] = []
+        self._lock = threading.Lock()
+
+        # Rebuilt on every change and replaced whole, so dispatching never needs the lock
+        self._everything: list[Subscription] = []
+        self._by_key: dict[str, list[Subscription]] = {}
+        self._by_prefix: dict[str, list[Subscription]] = {}
+        self._prefix_lengths: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, handler: UpdateHandler, keys: Iterable[str] = None,
+                  prefixes: Iterable[str] = None) -> Subscription:
+        # The handler is called once per update with only the keys it is interested in
+        subscription = Subscription(handler, keys, prefixes)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+            self._index()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions = [existing for existing in self._subscriptions if existing is not subscription]
+            self._index()
+
+    def dispatch(self, update: dict) -> int:
+        # Returns how many handlers were called
+        everything = self._everything
+        by_key = self._by_key
+        by_prefix = self._by_prefix
+        prefix_lengths = self._prefix_lengths
+
+        matched: dict[Subscription, dict] = {}
+        if by_key or by_prefix:
+            for key, value in update.items():
+                for subscription in by_key.get(key, ()):
+                    matched.setdefault(subscription, {})[key] = value
+                for length in prefix_lengths:
+                    for subscription in by_prefix.get(key[:length], ()):
+                        matched.setdefault(subscription, {})[key] = value
+
+        for subscription in everything:
+            subscription.handler(update)
+        for subscription, values in matched.items():
+            subscription.handler(values)
+
+        return len(everything) + len(matched)
+
+    def _index(self) -> None:
+        everything = []
+        by_key: dict[str, list[Subscription]] = {}
+        by_prefix: dict[str, list[Subscription]] = {}
+        for subscription in self._subscriptions:
+            if subscription.everything:
+                everything.append(subscription)
+            for key in subscription.keys:
+                by_key.setdefault(key, []).append(subscription)
+            for prefix in subscription.prefixes:
+                by_prefix.setdefault(prefix, []).append(subscription)
+
+        # Looking up each distinct prefix length is cheaper than comparing every key with every prefix
+        self._prefix_lengths = sorted({len(prefix) for prefix in by_prefix})
+        self._everything, self._by_key, self._by_prefix = everything, by_key, by_prefix
@@ -0,0 +1,253 @@
+# wire_codec.py
+# Encodings for messages on the wire. JSON is what every server understands; the compact binary encoding is a
+# MessagePack subset used once both ends have agreed on it. Either can be decoded at any time, as binary frames
+# are marked (see framing.py), so switching encodings mid-stream is safe
+
+import json
+import struct
+from typing import Any
+
+from framing import MESSAGE_DELIMITER, BINARY_FRAME_MARKER, BINARY_HEADER_SIZE
+
+JSON_CODEC = "json"
+BINARY_CODEC = "msgpack"
+
+# Faster JSON libraries are used when installed; all produce and accept the same documents
+try:
+    import orjson
+
+    def dump_json(message: Any) -> bytes:
+        return orjson.dumps(message)
+
+    _load_json = orjson.loads
+    JSON_LIBRARY = "orjson"
+
+except ImportError:
+    try:
+        import ujson
+
+        def dump_json(message: Any) -> bytes:
+            return ujson.dumps(message, ensure_ascii=False).encode()
+
+        def _load_json(frame: Any) -> Any:
+            return ujson.loads(str(frame, "utf-8"))
+
+        JSON_LIBRARY = "ujson"
+
+    except ImportError:
+        def dump_json(message: Any) -> bytes:
+            return json.dumps(message, separators=(",", ":")).encode()
+
+        def _load_json(frame: Any) -> Any:
+            # str() decodes memoryviews, which json.loads does not accept, without copying them to bytes first
+            return json.loads(str(frame, "utf-8"))
+
+        JSON_LIBRARY = "json"
+
+try:
+    import msgpack
+
+    def pack(value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def unpack(data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+except ImportError:
+    msgpack = None
+
+_float32 = struct.Struct(">f")
+_float64 = struct.Struct(">d")
+_integer_formats = [  # (minimum, maximum, type byte, format), smallest first
+    (-0x80, 0x7F, 0xD0, ">b"),
+    (0, 0xFF, 0xCC, ">B"),
+    (-0x8000, 0x7FFF, 0xD1, ">h"),
+    (0, 0xFFFF, 0xCD, ">H"),
+    (-0x80000000, 0x7FFFFFFF, 0xD2, ">i"),
+    (0, 0xFFFFFFFF, 0xCE, ">I"),
+    (-0x8000000000000000, 0x7FFFFFFFFFFFFFFF, 0xD3, ">q"),
+    (0, 0xFFFFFFFFFFFFFFFF, 0xCF, ">Q"),
+]
+
+
+def _pack_length(output: bytearray, length: int, fixed_type: int, fixed_limit: int, sized_types: list[int]) -> None:
+    if fixed_type is not None and length < fixed_limit:
+        output.append(fixed_type | length)
+    elif length <= 0xFF and sized_types[0] is not None:
+        output.append(sized_types[0])
+        output.append(length)
+    elif length <= 0xFFFF:
+        output.append(sized_types[1])
+        output += length.to_bytes(2, "big")
+    else:
+        output.append(sized_types[2])
+        output += length.to_bytes(4, "big")
+
+
+def _pack_into(output: bytearray, value: Any) -> None:
+    if value is None:
+        output.append(0xC0)
+    elif value is True:
+        output.append(0xC3)
+    elif value is False:
+        output.append(0xC2)
+    elif isinstance(value, int):
+        if -32 <= value < 128:
+            output.append(value & 0xFF)
+            return
+        for minimum, maximum, type_byte, integer_format in _integer_formats:
+            if minimum <= value <= maximum:
+                output.append(type_byte)
+                output += struct.pack(integer_format, value)
+                return
+        raise ValueError(f"Integer {value} is too large to encode")
+    elif isinstance(value, float):
+        # Single precision when it loses nothing, which covers most positions and set points
+        try:
+            single = _float32.pack(value)
+        except (struct.error, OverflowError):
+            single = None  # Beyond single precision's range
+        if single is not None and _float32.unpack(single)[0] == value:
+            output.append(0xCA)
+            output += single
+        else:
+            output.append(0xCB)
+            output += _float64.pack(value)
+    elif isinstance(value, str):
+        encoded = value.encode()
+        _pack_length(output, len(encoded), 0xA0, 32, [0xD9, 0xDA, 0xDB])
+        output += encoded
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _pack_length(output, len(value), None, 0, [0xC4, 0xC5, 0xC6])
+        output += value
+    elif isinstance(value, (list, tuple)):
+        _pack_length(output, len(value), 0x90, 16, [None, 0xDC, 0xDD])
+        for item in value:
+            _pack_into(output, item)
+    elif isinstance(value, dict):
+        _pack_length(output, len(value), 0x80, 16, [None, 0xDE, 0xDF])
+        for key, item in value.items():
+            _pack_into(output, key)
+            _pack_into(output, item)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _unpack_from(data: bytes, offset: int) -> tuple[Any, int]:
+    type_byte = data[offset]
+    offset += 1
+
+    if type_byte <= 0x7F:
+        return type_byte, offset
+    if type_byte >= 0xE0:
+        return type_byte - 0x100, offset
+    if 0xA0 <= type_byte <= 0xBF:
+        end = offset + (type_byte & 0x1F)
+        return str(data[offset:end], "utf-8"), end
+    if 0x90 <= type_byte <= 0x9F:
+        return _unpack_array(data, offset, type_byte & 0x0F)
+    if 0x80 <= type_byte <= 0x8F:
+        return _unpack_map(data, offset, type_byte & 0x0F)
+
+    if type_byte == 0xC0:
+        return None, offset
+    if type_byte == 0xC2:
+        return False, offset
+    if type_byte == 0xC3:
+        return True, offset
+    if type_byte == 0xCA:
+        return _float32.unpack_from(data, offset)[0], offset + 4
+    if type_byte == 0xCB:
+        return _float64.unpack_from(data, offset)[0], offset + 8
+
+    for _minimum, _maximum, integer_type, integer_format in _integer_formats:
+        if type_byte == integer_type:
+            return struct.unpack_from(integer_format, data, offset)[0], offset + struct.calcsize(integer_format)
+
+    sizes = {0xD9: 1, 0xDA: 2, 0xDB: 4, 0xC4: 1, 0xC5: 2, 0xC6: 4, 0xDC: 2, 0xDD: 4, 0xDE: 2, 0xDF: 4}
+    if type_byte not in sizes:
+        raise ValueError(f"Unsupported type byte 0x{type_byte:02X}")
+
+    size = sizes[type_byte]
+    length = int.from_bytes(data[offset:offset + size], "big")
+    offset += size
+    if type_byte in (0xD9, 0xDA, 0xDB):
+        return str(data[offset:offset + length], "utf-8"), offset + length
+    if type_byte in (0xC4, 0xC5, 0xC6):
+        return bytes(data[offset:offset + length]), offset + length
+    if type_byte in (0xDC, 0xDD):
+        return _unpack_array(data, offset, length)
+    return _unpack_map(data, offset, length)
+
+
+def _unpack_array(data: bytes, offset: int, length: int) -> tuple[list, int]:
+    items = []
+    for _ in range(length):
+        item, offset = _unpack_from(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data: bytes, offset: int, length: int) -> tuple[dict, int]:
+    mapping = {}
+    for _ in range(length):
+        key, offset = _unpack_from(data, offset)
+        mapping[key], offset = _unpack_from(data, offset)
+    return mapping, offset
+
+
+if msgpack is None:
+    def pack(value: Any) -> bytes:
+        output = bytearray()
+        _pack_into(output, value)
+        return bytes(output)
+
+    def unpack(data: bytes) -> Any:
+        try:
+            value, end = _unpack_from(data, 0)
+        except (IndexError, struct.error, UnicodeDecodeError) as exception:
+            raise ValueError("Truncated or corrupt binary message") from exception
+        if end != len(data):
+            raise ValueError("Trailing data after binary message")
+        return value
+
+
+class WireCodec:
+    name = JSON_CODEC
+
+    def encode(self, message: Any) -> bytes:
+        # Returns the message framed and ready to send
+        return dump_json(message) + MESSAGE_DELIMITER
+
+    @staticmethod
+    def decode(frame: bytes) -> Any:
+        # Accepts a frame of any codec; raises ValueError if it is malformed
+        return decode_frame(frame)
+
+
+class BinaryCodec(WireCodec):
+    name = BINARY_CODEC
+
+    def encode(self, message: Any) -> bytes:
+        packed = pack(message)
+        if len(packed) > 0xFFFF:
+            raise ValueError("Message too large for a binary frame")
+        return bytes((BINARY_FRAME_MARKER,)) + len(packed).to_bytes(2, "big") + packed
+
+
+codecs = {codec.name: codec for codec in [WireCodec(), BinaryCodec()]}
+json_codec = codecs[JSON_CODEC]
+
+
+def decode_frame(frame: bytes | memoryview) -> Any:
+    if frame and frame[0] == BINARY_FRAME_MARKER:
+        return unpack(frame[BINARY_HEADER_SIZE:])
+    return _load_json(frame)
+
+
+def choose_codec(offered: list[str]) -> WireCodec:
+    # The first offered codec this end knows, falling back on JSON
+    for name in offered:
+        if name in codecs:
+            return codecs[name]
+    return json_codec
@@ -0,0 +1,113 @@
+# conftest.py
+# Shared fixtures: the interfaces pointed at free local ports, served by a RemoteServer or answered by hand
+# Run from the interface_client folder: python -m pytest tests
+
+import asyncio
+import socket
+import sys
+import threading
+from pathlib import Path
+from time import perf_counter as check_timer, sleep
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import fleet
+import remote_interface
+from framing import StreamDecoder
+from server import RemoteServer
+from wire_codec import decode_frame, json_codec
+
+WAIT = 2.0  # Seconds a test waits for something that should happen promptly
+
+
+def wait_until(condition) -> None:
+    deadline = check_timer() + WAIT
+    while not condition():
+        assert check_timer() < deadline, "Timed out waiting"
+        sleep(0.01)
+
+
+class FakeController:  # Listens on both ports like a controller, but the test reads and answers every command itself
+    def __init__(self):
+        self.commander_listener = socket.create_server(("127.0.0.1", 0))
+        self.updater_listener = socket.create_server(("127.0.0.1", 0))
+        self.ports = (self.commander_listener.getsockname()[1], self.updater_listener.getsockname()[1])
+        self.commander: socket.socket = None
+        self.updater: socket.socket = None
+        self._decoder = StreamDecoder()
+
+    def accept(self) -> None:
+        for listener in [self.commander_listener, self.updater_listener]:
+            listener.settimeout(WAIT)
+        self.commander, _ = self.commander_listener.accept()
+        self.updater, _ = self.updater_listener.accept()
+        self.commander.settimeout(WAIT)
+        self._decoder = StreamDecoder()
+
+    def read_commands(self, count: int) -> list[dict]:
+        commands = []
+        while len(commands) < count:
+            commands += [decode_frame(message) for message in self._decoder.messages()]
+            if len(commands) < count and not self._decoder.receive(self.commander, 4096):
+                raise ConnectionError("Client closed the connection")
+        return commands
+
+    def answer(self, ticket: int, response: dict = None) -> None:
+        self.commander.sendall(json_codec.encode({**(response or {"response": "OK"}), "ticket": ticket}))
+
+    def send_update(self, update: dict) -> None:
+        self.updater.sendall(json_codec.encode(update))
+
+    def drop(self) -> None:
+        # Ends the current connections, and refuses new ones until listen is called
+        for connection in [self.commander, self.updater, self.commander_listener, self.updater_listener]:
+            connection.close()
+
+    def listen(self) -> None:
+        self.commander_listener = socket.create_server(("127.0.0.1", self.ports[0]))
+        self.updater_listener = socket.create_server(("127.0.0.1", self.ports[1]))
+
+    def close(self) -> None:
+        for connection in [self.commander, self.updater, self.commander_listener, self.updater_listener]:
+            if connection is not None:
+                connection.close()
+
+
+def use_ports(monkeypatch, ports: tuple[int, int]) -> None:
+    for module in [remote_interface, fleet]:
+        monkeypatch.setattr(module, "COMMANDER_PORT", ports[0])
+        monkeypatch.setattr(module, "UPDATER_PORT", ports[1])
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def controller(monkeypatch) -> FakeController:
+    fake = FakeController()
+    use_ports(monkeypatch, fake.ports)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def server(monkeypatch) -> RemoteServer:
+    # Served from an event loop on its own thread, so the blocking interfaces can be used from the test
+    ports = (free_port(), free_port())
+    use_ports(monkeypatch, ports)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    served = RemoteServer("127.0.0.1", *ports)
+    asyncio.run_coroutine_threadsafe(served.start(), loop).result()
+    yield served
+    asyncio.run_coroutine_threadsafe(served.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
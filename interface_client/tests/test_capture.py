@@ -0,0 +1,28 @@
+# test_capture.py
+# Captures appended to by several runs, whose monotonic timestamps do not compare
+
+from capture import CaptureWriter, CaptureRecord, read_capture, SESSION, COMMAND, UPDATE
+from replay import scheduled, describe
+
+
+def test_every_writer_starts_a_session(tmp_path):
+    path = tmp_path / "capture.bin"
+    for run in range(2):
+        with CaptureWriter(path) as capture:
+            capture.record(COMMAND, b'{"command": "ping"}')
+
+    assert [record.kind for record in read_capture(path)] == [SESSION, COMMAND, SESSION, COMMAND]
+
+
+def test_each_session_is_paced_from_where_the_last_left_off():
+    second = 10 ** 9
+    records = [
+        CaptureRecord(5000 * second, SESSION, b""),
+        CaptureRecord(5000 * second + second // 10, UPDATE, b"{}"),
+        CaptureRecord(3 * second, SESSION, b""),  # After a reboot, so earlier than the last session's
+        CaptureRecord(3 * second + second // 5, UPDATE, b"{}"),
+    ]
+    dues = [due for due, _ in scheduled(records, speed=2.0)]
+    offsets = [round(due - dues[0], 6) for due in dues]
+    assert offsets == [0.0, 0.05, 0.05, 0.15]
+    assert describe(records)["duration"] == "0.300s"
@@ -0,0 +1,67 @@
+# test_fleet.py
+# RemoteInterfaceFleet's single I/O thread: cancelled and silent commands must never stop it
+
+from concurrent.futures import CancelledError
+
+import pytest
+
+from conftest import WAIT, wait_until
+from fleet import RemoteInterfaceFleet
+from remote_interface import error_code
+
+
+def test_response_to_cancelled_command_keeps_the_fleet_running(controller):
+    fleet = RemoteInterfaceFleet({"a": "127.0.0.1"})
+    controller.accept()
+    try:
+        cancelled = fleet.submit("slow")["a"]
+        [command] = controller.read_commands(1)
+        assert cancelled.cancel()
+        controller.answer(command["ticket"])  # Arrives after the caller gave up on it
+
+        later = fleet.submit("ping")["a"]
+        [ping] = controller.read_commands(1)
+        controller.answer(ping["ticket"])
+        assert later.result(WAIT)["ticket"] == ping["ticket"]
+        assert fleet.io_thread.is_alive()
+        with pytest.raises(CancelledError):
+            cancelled.result()
+    finally:
+        fleet.quit()
+
+
+def test_silent_controller_times_out(controller):
+    fleet = RemoteInterfaceFleet({"a": "127.0.0.1"}, timeout=0.1)
+    controller.accept()
+    try:
+        assert fleet.execute("ping")["a"]["error_code"] == error_code["TIMEOUT"]
+        assert fleet["a"].execute("ping")["error_code"] == error_code["TIMEOUT"]
+        assert [response["error_code"] for response in fleet.execute_many([("ping", None)] * 2)["a"]] == \
+               [error_code["TIMEOUT"]] * 2
+
+        # Their tickets are freed, so the late answers are ignored rather than taken for newer commands
+        assert len(fleet._controllers["a"].pending) == 0
+        for command in controller.read_commands(4):
+            controller.answer(command["ticket"], {"response": "LATE"})
+        later = fleet.submit("ping")["a"]
+        [ping] = controller.read_commands(1)
+        controller.answer(ping["ticket"])
+        assert later.result(WAIT)["response"] == "OK"
+    finally:
+        fleet.quit()
+
+
+def test_full_update_queue_pushes_back_without_stopping_commands(server):
+    # Each update's receiver runs a command, which the I/O thread must still serve while the queue is full
+    responses = []
+    fleet = RemoteInterfaceFleet({"a": "127.0.0.1"}, update_queue_size=4,
+                                 update_receiver=lambda name, update: responses.append(fleet.execute("ping")))
+    try:
+        wait_until(lambda: server.client_count and len(server._update_clients))
+        for index in range(50):
+            server.publish({"index": index})
+        wait_until(lambda: len(responses) == 50)
+        assert all(response["a"]["response"] == "OK" for response in responses)
+        assert fleet.update_queue.stats()["dropped"] == 0
+    finally:
+        fleet.quit()
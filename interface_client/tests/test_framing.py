@@ -0,0 +1,112 @@
+# test_framing.py
+# StreamDecoder's buffer arithmetic: partial messages, split delimiters, compaction and growth, abandoned iteration
+# Run from the interface_client folder: python -m pytest tests
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from framing import StreamDecoder, BINARY_FRAME_MARKER
+
+
+class ChunkSocket:  # Hands out the given chunks one per recv_into, as a socket might split a stream
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view) -> int:
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        if len(chunk) > len(view):  # The rest is left for the next read
+            chunk, self.chunks[:0] = chunk[:len(view)], [chunk[len(view):]]
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def binary_frame(payload: bytes) -> bytes:
+    return bytes((BINARY_FRAME_MARKER, len(payload) >> 8, len(payload) & 0xFF)) + payload
+
+
+def receive_all(decoder: StreamDecoder, chunks: list[bytes], size: int = 4096) -> list[bytes]:
+    connection = ChunkSocket(chunks)
+    messages = []
+    while decoder.receive(connection, size):
+        messages += [bytes(message) for message in decoder.messages()]
+    return messages
+
+
+def test_partial_messages_wait_for_the_rest():
+    decoder = StreamDecoder()
+    assert decoder.feed(b'{"a": 1}\n{"b"') == [b'{"a": 1}']
+    assert len(decoder) == len(b'{"b"')
+    assert decoder.feed(b': 2}') == []
+    assert decoder.feed(b'\n') == [b'{"b": 2}']
+    assert len(decoder) == 0
+
+
+def test_delimiter_split_across_reads():
+    decoder = StreamDecoder(delimiter=b"\r\n")
+    assert decoder.feed(b"first\r") == []
+    assert decoder.feed(b"\nsecond\r") == [b"first"]
+    assert decoder.feed(b"\n") == [b"second"]
+
+
+def test_every_split_point_gives_the_same_messages():
+    stream = b'{"a": 1}\n\n{"b": [2, 3]}\r\n' + binary_frame(b"\x81\xa1c\x04") + b'{"d": "e"}\n'
+    expected = [b'{"a": 1}', b'{"b": [2, 3]}\r', binary_frame(b"\x81\xa1c\x04"), b'{"d": "e"}']
+    for split in range(len(stream) + 1):
+        decoder = StreamDecoder()
+        assert decoder.feed(stream[:split]) + decoder.feed(stream[split:]) == expected, split
+
+
+def test_compaction_moves_partial_message_to_front():
+    # A small buffer fills up, so the partial message is moved back to the front between reads
+    decoder = StreamDecoder(capacity=32)
+    messages = [f'{{"n": {index}}}'.encode() for index in range(50)]
+    stream = b"\n".join(messages) + b"\n"
+    chunks = [stream[offset:offset + 7] for offset in range(0, len(stream), 7)]
+    assert receive_all(decoder, chunks, size=8) == messages
+    assert len(decoder._buffer) == 32  # Reused throughout rather than grown
+
+
+def test_buffer_grows_for_long_messages():
+    decoder = StreamDecoder(capacity=16)
+    message = b"x" * 10000
+    assert receive_all(decoder, [message[:5000], message[5000:] + b"\nend\n"]) == [message, b"end"]
+    assert len(decoder._buffer) >= len(message)
+
+
+def test_abandoned_iteration_resumes_at_first_unread_message():
+    decoder = StreamDecoder(capacity=32)
+    connection = ChunkSocket([b"one\ntwo\nthree\nfour", b"\nfive\n"])
+    decoder.receive(connection, size=18)
+
+    messages = decoder.messages()
+    assert bytes(next(messages)) == b"one"
+    messages.close()  # The caller stops early, e.g. to handle a response before reading on
+
+    # The next read moves the unread bytes to the front before the rest arrives
+    decoder.receive(connection, size=24)
+    assert [bytes(message) for message in decoder.messages()] == [b"two", b"three", b"four", b"five"]
+
+
+def test_abandoned_iteration_over_mixed_frames():
+    decoder = StreamDecoder(capacity=32)
+    frame = binary_frame(b"\x01\x02")
+    connection = ChunkSocket([frame + b"text\n" + frame, b"tail\n"])
+    decoder.receive(connection, size=20)
+
+    messages = decoder.messages()
+    assert bytes(next(messages)) == frame
+    messages.close()
+
+    decoder.receive(connection, size=20)
+    assert [bytes(message) for message in decoder.messages()] == [b"text", frame, b"tail"]
+
+
+def test_oversized_garbage_is_discarded():
+    decoder = StreamDecoder(max_message_size=64)
+    assert decoder.feed(b"y" * 100) == []
+    assert decoder.discarded_bytes == 100
+    assert decoder.feed(b"ok\n") == [b"ok"]
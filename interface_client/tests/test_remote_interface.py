@@ -0,0 +1,155 @@
+# test_remote_interface.py
+# RemoteInterface's tickets, reconnection and replay, deadlines and cancellation, against a hand-answered controller
+
+from concurrent.futures import CancelledError
+from time import perf_counter as check_timer
+
+import pytest
+
+from conftest import WAIT, wait_until
+from remote_interface import RemoteInterface, PendingCommands, MAX_TICKET, error_code
+
+
+def interface(**options) -> RemoteInterface:
+    # No health pings, which the tests would otherwise have to answer
+    return RemoteInterface("127.0.0.1", ping_interval=0, **options)
+
+
+def test_tickets_skip_those_still_pending_after_wrapping():
+    pending = PendingCommands()
+    assert pending.register("first") == 1
+    for _ in range(MAX_TICKET - 1):
+        pending.discard(pending.register("answered"))
+
+    assert pending.register("second") == 2  # Wrapped past MAX_TICKET, and 1 is still awaiting its response
+    assert pending.resolve({"response": "OK", "ticket": 1}) == "first"
+    assert pending.resolve({"response": "OK", "ticket": 1}) is None  # Answered twice, or after being forgotten
+
+    for _ in range(MAX_TICKET - 1):
+        pending.register("waiting")
+    with pytest.raises(RuntimeError):
+        pending.register("one too many")
+
+
+def test_late_response_to_forgotten_ticket_is_ignored(controller):
+    ri = interface()
+    controller.accept()
+    try:
+        timed_out = ri.submit("slow", timeout=0.05)
+        assert timed_out.result(WAIT)["error_code"] == error_code["TIMEOUT"]
+        later = ri.submit("ping")
+        slow, ping = controller.read_commands(2)
+
+        controller.answer(slow["ticket"], {"response": "LATE"})
+        controller.answer(ping["ticket"])
+        assert later.result(WAIT) == {"response": "OK", "ticket": ping["ticket"]}
+        assert timed_out.result()["error_code"] == error_code["TIMEOUT"]
+        assert len(ri._pending) == 0
+    finally:
+        ri.quit()
+
+
+def test_deadlines_expire_in_order_of_deadline(controller):
+    ri = interface()
+    controller.accept()
+    try:
+        finished = []
+        for timeout in [0.3, 0.1, 0.2]:
+            ri.submit("slow", callback=lambda response, timeout=timeout: finished.append(timeout), timeout=timeout)
+        started = check_timer()
+        assert ri.execute_within(0.05, "slow")["error_code"] == error_code["TIMEOUT"]
+        assert check_timer() - started < WAIT
+
+        wait_until(lambda: len(finished) == 3)
+        assert finished == [0.1, 0.2, 0.3]
+        assert len(ri._pending) == 0
+    finally:
+        ri.quit()
+
+
+def test_cancel_all_cancels_unanswered_commands(controller):
+    ri = interface()
+    controller.accept()
+    try:
+        futures = ri.submit_many([("slow", None)] * 3)
+        commands = controller.read_commands(3)
+        assert ri.cancel_all() == 3
+        assert all(future.cancelled() for future in futures)
+
+        for command in commands:
+            controller.answer(command["ticket"])  # Late, so ignored
+        later = ri.submit("ping")
+        [ping] = controller.read_commands(1)
+        controller.answer(ping["ticket"])
+        assert later.result(WAIT)["ticket"] == ping["ticket"]
+        with pytest.raises(CancelledError):
+            futures[0].result()
+    finally:
+        ri.quit()
+
+
+def test_commands_replay_in_order_after_a_drop(controller):
+    ri = interface()
+    controller.accept()
+    try:
+        in_flight = ri.submit_many([("first", None), ("second", None)])
+        controller.read_commands(2)
+        controller.drop()
+        wait_until(lambda: not ri.connected)
+
+        queued = ri.submit_many([("third", None), ("fourth", None)])
+        controller.listen()
+        controller.accept()
+        commands = controller.read_commands(4)
+        assert [command["command"] for command in commands] == ["first", "second", "third", "fourth"]
+
+        for command in commands:
+            controller.answer(command["ticket"], {"response": "DATA", "payload": command["command"]})
+        assert [future.result(WAIT)["payload"] for future in in_flight + queued] == \
+               ["first", "second", "third", "fourth"]
+    finally:
+        ri.quit()
+
+
+def test_replay_queue_overflow_fails_the_newest(controller):
+    ri = interface(replay_limit=2)
+    controller.accept()
+    try:
+        in_flight = ri.submit("first")
+        controller.read_commands(1)
+        controller.drop()
+        wait_until(lambda: not ri.connected)
+
+        second, third = ri.submit_many([("second", None), ("third", None)])
+        with pytest.raises(ConnectionError):
+            third.result(WAIT)  # Only room for the command in flight and one more
+
+        second.cancel()  # Skipped on replay
+        controller.listen()
+        controller.accept()
+        [command] = controller.read_commands(1)
+        assert command["command"] == "first"
+        controller.answer(command["ticket"])
+        assert in_flight.result(WAIT)["response"] == "OK"
+
+        later = ri.submit("ping")
+        [ping] = controller.read_commands(1)
+        assert ping["command"] == "ping"
+    finally:
+        ri.quit()
+
+
+def test_full_update_queue_does_not_hold_back_multiplexed_responses(server):
+    # Each update's receiver runs a command, whose answer comes in behind the updates on the one connection
+    responses = []
+    ri = RemoteInterface("127.0.0.1", multiplex=True, update_queue_size=2, ping_interval=0,
+                         update_receiver=lambda update: responses.append(ri.execute("ping")))
+    try:
+        assert ri.multiplexed
+        for index in range(20):
+            server.publish({"index": index})
+        wait_until(lambda: len(responses) == 20)
+        assert all(response["response"] == "OK" for response in responses)
+        assert ri.update_queue.stats()["dropped"] == 0
+    finally:
+        ri.quit()